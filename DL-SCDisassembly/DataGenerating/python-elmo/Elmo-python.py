@@ -1,59 +1,58 @@
 import os
+import itertools
 import pandas as pd
 import numpy as np
 from elmo.engine import ELMOEngine, Instr
 import matplotlib.pyplot as plt
 
-def generate_power(filename, parent_folder_path, savepath):
-    csv_file_path = os.path.join(parent_folder_path, filename)
-    df = pd.read_csv(csv_file_path)
-
-    # get the instances of the instruction, operands as hex and value form the dataset
-    hex_list = df['address'].tolist()
-    operands_list_hex = [int(x, 16) for x in hex_list]
-    value_list = df['value'].tolist()
-    instr = df['type'].tolist()
-
-    # convert instruction strings to their corresponding enum values
-    instr = [eval(instruction) for instruction in instr]
-    power = []
-    engine = ELMOEngine()
+def read_points(csv_file_path, chunk_size):
+    """ yield the ELMO points of the CSV file chunk by chunk, along with the rows labelling them.
+    a point needs the previous, current and next instructions,
+    so the last two rows of a chunk are carried over to the next one
+    """
+    carry = None
+    for df in pd.read_csv(csv_file_path, chunksize=chunk_size):
+        if carry is not None:
+            df = pd.concat([carry, df], ignore_index=True)
+        carry = df.iloc[-2:]
+        if len(df) < 3:
+            continue
 
-    # retrieve instances for the previous, current, and next instructions
-    for i in range(1, len(instr) - 1):
-        previous_type = instr[i-1]
-        current_type = instr[i]
-        next_type = instr[i+1]
+        # get the instances of the instruction, operands as hex and value form the dataset
+        operands_hex = np.array([int(x, 16) for x in df['address']])
+        value = df['value'].to_numpy()
 
-        previous_operands_hex = operands_list_hex[i-1]
-        previous_value = value_list[i-1]
+        # convert instruction strings to their corresponding enum values
+        instr = df['type'].map({instruction: eval(instruction) for instruction in df['type'].unique()}).to_numpy(dtype=int)
 
-        current_operands_hex = operands_list_hex[i]
-        current_value = value_list[i]
-        # add the point to the ELMO engine
-        engine.add_point(
-            (previous_type, current_type, next_type),
-            (previous_operands_hex, previous_value),
-            (current_operands_hex, current_value)
+        # retrieve instances for the previous, current, and next instructions
+        points = (
+            np.stack([instr[:-2], instr[1:-1], instr[2:]]),
+            np.stack([operands_hex[:-2], value[:-2]]),
+            np.stack([operands_hex[1:-1], value[1:-1]]),
         )
+        yield points, df.iloc[:-2]
 
-    # compute the power consumption of all these points
-    engine.run()
-    power = engine.power
-    # reset the engine to study other points
-    engine.reset_points()
+def generate_power(filename, parent_folder_path, savepath, chunk_size=100000):
+    csv_file_path = os.path.join(parent_folder_path, filename)
+    power_file_path = os.path.join(savepath, f'{os.path.splitext(filename)[0]}_power_trace.csv')
+    engine = ELMOEngine()
 
-    # saving the generated power as a CSV file along with corresponding instruction
-    power_df = pd.DataFrame(power, columns=['Power'])
-    power_df['type'] = df['type']
-    power_df['instruction'] = df['instruction']
-    power_df['label'] = df['label'] 
-    power_df['context'] = df['context']
+    # compute the power consumption chunk by chunk, so the memory stays bounded for large files
+    points, rows = itertools.tee(read_points(csv_file_path, chunk_size))
+    powers = engine.stream(chunk for chunk, _ in points)
 
+    first_chunk = True
+    for power, (_, chunk_rows) in zip(powers, rows):
+        # saving the generated power as a CSV file along with corresponding instruction
+        power_df = pd.DataFrame(power, columns=['Power'])
+        power_df['type'] = chunk_rows['type'].to_numpy()
+        power_df['instruction'] = chunk_rows['instruction'].to_numpy()
+        power_df['label'] = chunk_rows['label'].to_numpy()
+        power_df['context'] = chunk_rows['context'].to_numpy()
 
-    #power_df['context'] = df['context']
-    power_file_path = os.path.join(savepath, f'{os.path.splitext(filename)[0]}_power_trace.csv')
-    power_df.to_csv(power_file_path, index=False)
+        power_df.to_csv(power_file_path, index=False, mode='w' if first_chunk else 'a', header=first_chunk)
+        first_chunk = False
 
 parent_folder_path = r'parent_folder_path'
 savepath = r'savepath'
@@ -56,9 +56,37 @@ if command == 'run-server':
     
     host = sys.argv[2] if len(sys.argv) >= 3 else DEFAULT_HOST
     port = int(sys.argv[3]) if len(sys.argv) >= 4 else DEFAULT_PORT
+    nb_workers = int(sys.argv[4]) if len(sys.argv) >= 5 else None
 
-    launch_executor(host, port)
+    launch_executor(host, port, nb_workers=nb_workers)
     exit()
-    
+
+if command == 'benchmark':
+    import json
+    from .benchmark import benchmark_engine
+
+    max_nb_points = int(float(sys.argv[2])) if len(sys.argv) >= 3 else 10**7
+    output_filename = sys.argv[3] if len(sys.argv) >= 4 else None
+
+    nb_points_list = [10**k for k in range(3, 8) if 10**k <= max_nb_points]
+    report = json.dumps(benchmark_engine(nb_points_list, verbose=True), indent=2)
+    if output_filename:
+        with open(output_filename, 'w') as _file:
+            _file.write(report)
+        print('Benchmark saved in {}'.format(output_filename))
+    else:
+        print(report)
+    exit()
+
+if command == 'benchmark-parallel':
+    from .benchmark import benchmark_parallel_scaling, print_parallel_scaling
+
+    nb_points = int(float(sys.argv[2])) if len(sys.argv) >= 3 else 10**6
+    max_workers = int(sys.argv[3]) if len(sys.argv) >= 4 else None
+
+    print('Computation of {} points with the ELMO engine...'.format(nb_points))
+    print_parallel_scaling(benchmark_parallel_scaling(nb_points, max_workers))
+    exit()
+
 print(Color.FAIL + 'Unknown Command.' + Color.ENDC)
 exit()
@@ -0,0 +1,98 @@
+import re
+import numpy as np
+
+_ADDRESS_PATTERN = re.compile(r'(?:0x)?([0-9a-fA-F]+):')
+
+def split_instruction(line):
+    """ Split a line of the ASM trace into a tuple (address, mnemonic, operands)
+    The address is -1 if the line does not start with one (as 'xxxxxxxx:')
+    """
+    parts = line.split(None, 1)
+    address = -1
+    if parts:
+        match = _ADDRESS_PATTERN.fullmatch(parts[0])
+        if match:
+            address = int(match.group(1), 16)
+            parts = parts[1].split(None, 1) if len(parts) > 1 else []
+    mnemonic = parts[0] if parts else ''
+    operands = parts[1].strip() if len(parts) > 1 else ''
+    return (address, mnemonic, operands)
+
+class AsmTraceIndex:
+    """ Columnar index of an ASM trace, parsed once
+    Each position of the trace has a line id (in 'lines'), a mnemonic id (in 'mnemonics'),
+        operands and an address, and each mnemonic has the sorted array of its positions.
+    The queries return numpy arrays of positions, which can be given to 'get_traces'.
+    """
+    def __init__(self, asmtrace):
+        """ Build the index of 'asmtrace' (list of instructions, one per line) """
+        line_ids = {line: line_id for line_id, line in enumerate(dict.fromkeys(asmtrace))}
+        self.lines = np.array(list(line_ids), dtype=str)
+        self.line_ids = np.fromiter(map(line_ids.__getitem__, asmtrace), dtype=np.int32, count=len(asmtrace))
+
+        # Parse only the distinct lines
+        addresses, mnemonics, operands = zip(*map(split_instruction, self.lines)) if len(self.lines) else ((), (), ())
+        self.mnemonics, line_mnemonic_ids = np.unique(np.array(mnemonics, dtype=str), return_inverse=True)
+        self._line_mnemonic_ids = line_mnemonic_ids.reshape(-1).astype(np.int32)
+        self._line_operands = np.array(operands, dtype=str)
+        self._line_addresses = np.array(addresses, dtype=np.int64)
+
+        self.mnemonic_ids = self._line_mnemonic_ids[self.line_ids]
+
+        # Inverted index: mnemonic -> positions
+        order = np.argsort(self.mnemonic_ids, kind='stable')
+        bounds = np.cumsum(np.bincount(self.mnemonic_ids, minlength=len(self.mnemonics)))
+        self._positions = dict(zip(self.mnemonics.tolist(), np.split(order, bounds[:-1])))
+
+    def __len__(self):
+        return len(self.line_ids)
+
+    @property
+    def operands(self):
+        """ Array of the operands (strings) of each position """
+        return self._line_operands[self.line_ids]
+
+    @property
+    def addresses(self):
+        """ Array of the addresses of each position (-1 if unknown) """
+        return self._line_addresses[self.line_ids]
+
+    def get_mnemonic(self, position):
+        """ Return the mnemonic of the instruction at 'position' """
+        return self.mnemonics[self.mnemonic_ids[position]]
+
+    def get_positions(self, mnemonics, start=None, stop=None):
+        """ Return the sorted array of the positions of the instructions with one of the 'mnemonics'
+        between the positions 'start' (included) and 'stop' (excluded)
+        :mnemonics: A mnemonic (string) or a list of mnemonics
+        """
+        if isinstance(mnemonics, str):
+            mnemonics = [mnemonics]
+        empty = np.zeros(0, dtype=np.intp)
+
+        chunks = []
+        for mnemonic in mnemonics:
+            positions = self._positions.get(mnemonic, empty)
+            first = np.searchsorted(positions, start) if start is not None else 0
+            last = np.searchsorted(positions, stop) if stop is not None else len(positions)
+            chunks.append(positions[first:last])
+
+        if len(chunks) == 1:
+            return chunks[0]
+        return np.sort(np.concatenate(chunks)) if chunks else empty
+
+    def search(self, condition, start=None, stop=None):
+        """ Return the sorted array of the positions of the instructions
+        whose mnemonic verifies the 'condition' (evaluated once per mnemonic)
+        :condition: Boolean function with a mnemonic (string) for input
+        """
+        mnemonics = [mnemonic for mnemonic in self.mnemonics.tolist() if condition(mnemonic)]
+        return self.get_positions(mnemonics, start, stop)
+
+    def get_indexes_of(self, condition):
+        """ Return the sorted array of the positions of the instructions
+        whose line verifies the 'condition' (evaluated once per distinct line)
+        :condition: Boolean function with an ASM instruction (string) for input
+        """
+        verified = np.array([bool(condition(line)) for line in self.lines.tolist()], dtype=bool)
+        return np.flatnonzero(verified[self.line_ids]) if len(self.lines) else np.zeros(0, dtype=np.intp)
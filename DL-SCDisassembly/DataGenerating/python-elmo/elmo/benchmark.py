@@ -0,0 +1,164 @@
+import os, sys
+import time
+import platform
+import numpy as np
+
+from .engine import ELMOEngine, STAGES
+from .config import ENGINE_CHUNK_SIZE
+
+### Inputs
+# Probabilities of the types (EOR, LSL, STR, LDR, MUL, OTHER) of the current instruction
+INSTRUCTION_MIXES = {
+    'uniform': [1/6] * 6,
+    'profiled': [1/5] * 5 + [0],
+    'mul': [0, 0, 0, 0, 1, 0],
+    'unprofiled': [0] * 5 + [1],
+}
+
+def random_points(nb_points, seed=0, mix='uniform'):
+    """ Return 'nb_points' random points for the ELMO engine
+    as a triplet (triplet, previous_ops, current_ops) of arrays
+    :mix: Name of the distribution of the type of the current instruction (see INSTRUCTION_MIXES)
+    """
+    rng = np.random.default_rng(seed)
+    triplet = rng.integers(0, 6, size=(3, nb_points))
+    triplet[1] = rng.choice(6, size=nb_points, p=INSTRUCTION_MIXES[mix])
+    previous_ops = rng.integers(0, 1 << 32, size=(2, nb_points))
+    current_ops = rng.integers(0, 1 << 32, size=(2, nb_points))
+    return (triplet, previous_ops, current_ops)
+
+### Benchmarks
+def benchmark_parallel_scaling(nb_points=10**6, max_workers=None, engine=None):
+    """ Measure the time of 'ELMOEngine.compute' on 'nb_points' random points
+    with 1, 2, 4, ... up to 'max_workers' processes (by default, the number of cores)
+    Return a list of dictionaries with the number of workers, the time (in seconds),
+        the throughput (in points per second) and the speedup compared to one worker
+    """
+    engine = engine or ELMOEngine()
+    max_workers = max_workers or os.cpu_count()
+    points = random_points(nb_points)
+
+    nb_workers_list = []
+    nb_workers = 1
+    while nb_workers < max_workers:
+        nb_workers_list.append(nb_workers)
+        nb_workers *= 2
+    nb_workers_list.append(max_workers)
+
+    results = []
+    for nb_workers in nb_workers_list:
+        start = time.perf_counter()
+        engine.compute(*points, nb_workers=nb_workers)
+        duration = time.perf_counter() - start
+        results.append({
+            'nb_workers': nb_workers,
+            'time': duration,
+            'points_per_second': nb_points / duration,
+            'speedup': results[0]['time'] / duration if results else 1.,
+        })
+    return results
+
+def print_parallel_scaling(results):
+    """ Print the results of 'benchmark_parallel_scaling' as a table """
+    print('{:>10} {:>10} {:>15} {:>8}'.format('workers', 'time (s)', 'points/s', 'speedup'))
+    for res in results:
+        print('{:>10} {:>10.3f} {:>15.0f} {:>8.2f}'.format(
+            res['nb_workers'],
+            res['time'],
+            res['points_per_second'],
+            res['speedup'],
+        ))
+
+def measure_precision(dtype=np.float32, points=None, coefficients=None):
+    """ Measure the error of an engine working with 'dtype' compared to float64
+    on the 'points' (by default, 10^5 random points)
+    Return a dictionary with the maximal absolute error and the maximal absolute power
+    """
+    points = points if points is not None else random_points(10**5)
+    reference = ELMOEngine(coefficients).compute(*points)
+    power = ELMOEngine(coefficients, dtype=dtype).compute(*points)
+    return {
+        'dtype': np.dtype(dtype).name,
+        'max_error': float(np.max(np.abs(power - reference))) if len(power) else 0.,
+        'max_power': float(np.max(np.abs(reference))) if len(power) else 0.,
+    }
+
+def _peak_rss():
+    """ Return the peak resident set size of the current process (in bytes),
+    or None if it is not available on this platform
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024 # Linux gives kibibytes
+
+def _benchmark_case(nb_points, mix, dtype, chunk_size, repeat):
+    """ Benchmark one case, in a dedicated process to measure its own peak RSS """
+    points = random_points(nb_points, mix=mix)
+    engine = ELMOEngine(dtype=dtype)
+    rss_before = _peak_rss()
+
+    best_time, best_timings = None, None
+    for _ in range(repeat):
+        timings = {}
+        start = time.perf_counter()
+        engine.compute(*points, chunk_size=chunk_size, timings=timings)
+        duration = time.perf_counter() - start
+        if (best_time is None) or (duration < best_time):
+            best_time, best_timings = duration, timings
+
+    return {
+        'nb_points': nb_points,
+        'mix': mix,
+        'dtype': np.dtype(dtype).name,
+        'chunk_size': chunk_size,
+        'time': best_time,
+        'points_per_second': nb_points / best_time,
+        'stages': {stage: best_timings.get(stage, 0.) for stage in STAGES},
+        'peak_rss_before': rss_before,
+        'peak_rss': _peak_rss(),
+    }
+
+def benchmark_engine(
+        nb_points_list=(10**3, 10**4, 10**5, 10**6, 10**7),
+        mixes=tuple(INSTRUCTION_MIXES),
+        dtypes=(np.float64, np.float32),
+        chunk_size=ENGINE_CHUNK_SIZE,
+        verbose=False,
+    ):
+    """ Measure the performance of 'ELMOEngine.compute' for each combination of
+    a number of points, an instruction mix (see INSTRUCTION_MIXES) and a floating-point type
+    Each case runs in a new process. Its time is the best of several runs (more for small batches).
+    Return a dictionary (serializable in JSON) with
+     - 'environment': the versions of Python and numpy, the platform and the number of cores,
+     - 'results': a list with, for each case, the time (in seconds), the throughput (in points per second),
+        the time spent in each stage of the computation (see elmo.engine.STAGES),
+        and the peak RSS (in bytes) before and after the computation.
+    """
+    import multiprocessing
+
+    results = []
+    for nb_points in nb_points_list:
+        repeat = max(1, min(10, 10**6 // nb_points))
+        for mix in mixes:
+            for dtype in dtypes:
+                with multiprocessing.Pool(1) as pool:
+                    result = pool.apply(_benchmark_case, (nb_points, mix, dtype, chunk_size, repeat))
+                if verbose:
+                    print('{:>10} points, {:>10}, {:>7}: {:>12.0f} points/s'.format(
+                        nb_points, mix, result['dtype'], result['points_per_second'],
+                    ), file=sys.stderr)
+                results.append(result)
+
+    return {
+        'environment': {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
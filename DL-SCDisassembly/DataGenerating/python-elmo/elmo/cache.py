@@ -0,0 +1,125 @@
+import os, shutil
+import json
+import hashlib
+import tempfile
+from os.path import join as pjoin
+
+from .config import (
+    ELMO_CACHE_DIRECTORY,
+    ELMO_CACHE_MAX_SIZE,
+    ELMO_STORE_TRACES_FILE_NAME,
+    ELMO_STORE_ASMTRACE_FILE_NAME,
+    ELMO_STORE_PRINTED_DATA_FILE_NAME,
+)
+
+RESULT_FILE_NAME = 'result.json'
+STORE_FILE_NAMES = [
+    ELMO_STORE_TRACES_FILE_NAME,
+    ELMO_STORE_ASMTRACE_FILE_NAME,
+    ELMO_STORE_PRINTED_DATA_FILE_NAME,
+]
+
+def _link_or_copy(source, destination):
+    """ Hard link 'source' to 'destination', or copy it if not possible """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+class ResultCache:
+    """ Content-addressed cache of the results of ELMO simulations
+    An entry is a repository with the binary store of the results (see 'SimulationProject.pack_results')
+        and the raw output of ELMO tool, named by a hash of the binary and of the input of the simulation.
+    When the cache exceeds 'max_size' bytes, the least recently used entries are removed.
+    """
+    def __init__(self, directory=ELMO_CACHE_DIRECTORY, max_size=ELMO_CACHE_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def get_key(filenames, data=b''):
+        """ Return the key (hexadecimal string) of the simulation
+        :filenames: List of the files which determine the results (binary, ELMO tool, ...)
+        :data: Input of ELMO tool (bytes)
+        """
+        digest = hashlib.sha256()
+        for filename in filenames:
+            with open(filename, 'rb') as _file:
+                for block in iter(lambda: _file.read(1 << 20), b''):
+                    digest.update(block)
+            digest.update(b'\0')
+        digest.update(data)
+        return digest.hexdigest()
+
+    def get_entry_path(self, key):
+        """ Return the path (string) of the repository of the entry 'key' """
+        return pjoin(self.directory, key)
+
+    def load(self, key, store_directory):
+        """ Put the results of the entry 'key' in the 'store_directory'
+        Return the raw output of ELMO tool, or None if the entry is not in the cache
+        """
+        entry_path = self.get_entry_path(key)
+        try:
+            with open(pjoin(entry_path, RESULT_FILE_NAME), 'r') as _file:
+                result = json.load(_file)
+            os.makedirs(store_directory, exist_ok=True)
+            for filename in STORE_FILE_NAMES:
+                if os.path.isfile(pjoin(entry_path, filename)):
+                    _link_or_copy(pjoin(entry_path, filename), pjoin(store_directory, filename))
+        except (OSError, ValueError):
+            return None # Missing, or removed at the same time by another process
+
+        os.utime(entry_path) # Most recently used
+        return result
+
+    def save(self, key, store_directory, result):
+        """ Add to the cache the results in the 'store_directory' as the entry 'key'
+        :result: Raw output of ELMO tool (serializable in JSON)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+        try:
+            for filename in STORE_FILE_NAMES:
+                if os.path.isfile(pjoin(store_directory, filename)):
+                    _link_or_copy(pjoin(store_directory, filename), pjoin(temp_path, filename))
+            with open(pjoin(temp_path, RESULT_FILE_NAME), 'w') as _file:
+                json.dump(result, _file)
+            os.replace(temp_path, self.get_entry_path(key))
+        except OSError:
+            pass # The entry has been added at the same time by another process
+        finally:
+            shutil.rmtree(temp_path, ignore_errors=True)
+        self.evict()
+
+    def get_entries(self):
+        """ Return the list of the entries as tuples (last use, size in bytes, key),
+        from the least recently used one
+        """
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('.') or not entry.is_dir():
+                continue
+            try:
+                size = sum(_file.stat().st_size for _file in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.name))
+            except OSError:
+                pass
+        return sorted(entries)
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache is at most 'max_size' bytes """
+        entries = self.get_entries()
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(self.get_entry_path(key), ignore_errors=True)
+            total_size -= size
+
+    def clear(self):
+        """ Remove all the entries of the cache """
+        for _, _, key in self.get_entries():
+            shutil.rmtree(self.get_entry_path(key), ignore_errors=True)
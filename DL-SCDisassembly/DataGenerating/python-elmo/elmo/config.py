@@ -8,11 +8,34 @@ ELMO_TOOL_REPOSITORY = 'elmo-tool'
 ELMO_EXECUTABLE_NAME = 'elmo'
 ELMO_OUTPUT_ENCODING = 'latin-1'
 ELMO_INPUT_FILE_NAME = 'input.txt'
+ELMO_COEFFICIENTS_FILE_NAME = 'coeffs.txt'
+
+# Binary store of the results of a simulation (in the output repository of ELMO tool)
+ELMO_STORE_REPOSITORY = 'store'
+ELMO_STORE_TRACES_FILE_NAME = 'traces.npy'
+ELMO_STORE_ASMTRACE_FILE_NAME = 'asmtrace.txt'
+ELMO_STORE_PRINTED_DATA_FILE_NAME = 'printdata.npy'
+
+# Working directories of the runs of ELMO tool
+ELMO_RUN_DIRECTORY = None # Parent repository of the working directories (None for the temporary repository of the system)
+ELMO_MAX_CONCURRENT_RUNS = os.cpu_count() or 1 # Maximal number of ELMO processes running at the same time
+
+# Cache of the results of the simulations
+ELMO_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'python-elmo')
+ELMO_CACHE_MAX_SIZE = 1 << 30 # In bytes, the least recently used results are removed beyond
+
+# Index of the simulation classes found by 'elmo.manage.search_simulations'
+ELMO_DISCOVERY_INDEX_FILE = os.path.join(ELMO_CACHE_DIRECTORY, 'discovery.json')
 
 MODULE_PATH = os.path.dirname(os.path.abspath(__file__))
 
 SEARCH_EXCLUSION_TAG = 'EXCLUDE-FROM-SIMULATION-SEARCH'
 
+# ELMO Engine
+ENGINE_CHUNK_SIZE = 1 << 16 # Number of points computed at once in streaming mode
+
 # ELMO Server
 DEFAULT_HOST = 'localhost'
-DEFAULT_PORT = 5000 
\ No newline at end of file
+DEFAULT_PORT = 5000 
+ELMO_SERVER_NB_WORKERS = ELMO_MAX_CONCURRENT_RUNS # Number of requests treated at the same time
+ELMO_SERVER_MAX_QUEUED_JOBS = 64 # Beyond, the server stops accepting connections until a job ends
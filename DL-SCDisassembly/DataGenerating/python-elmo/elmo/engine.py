@@ -2,8 +2,13 @@ import numpy as np
 import os
 from enum import IntEnum, unique
 
-from .utils import binary_writing
-from .config import ELMO_TOOL_REPOSITORY
+from .utils import binary_writing, byte_writing, StageTimer
+from .config import (
+    MODULE_PATH,
+    ELMO_TOOL_REPOSITORY,
+    ELMO_COEFFICIENTS_FILE_NAME,
+    ENGINE_CHUNK_SIZE,
+)
 
 @unique
 class Instruction(IntEnum):
@@ -21,10 +26,140 @@ PREVIOUS = 0
 CURRENT = 1
 SUBSEQUENT = 2
 
+# Components of the power leakage in the ELMO model
+COMPONENTS = (
+    'constant',
+    'PrvInstr', 'SubInstr',
+    'Operand1', 'Operand2',
+    'BitFlip1', 'BitFlip2',
+    'HWOp1PrvInstr', 'HWOp2PrvInstr',
+    'HDOp1PrvInstr', 'HDOp2PrvInstr',
+    'HWOp1SubInstr', 'HWOp2SubInstr',
+    'HDOp1SubInstr', 'HDOp2SubInstr',
+    'Operand1_bitinteractions', 'Operand2_bitinteractions',
+    'BitFlip1_bitinteractions', 'BitFlip2_bitinteractions',
+)
+
+# Stages of the computation of the power leakage, timed by 'ELMOEngine.calculate_point'
+STAGES = ('binary_decomposition', 'linear_terms', 'bit_interactions', 'type_terms_and_sum')
+
+### Coefficients of the model
+NB_COEFFICIENTS = 2153
+
+def read_coefficients(filename):
+    """ Read the coefficients of the ELMO model in the text file 'filename'
+    The parsed coefficients are cached in a binary file next to 'filename' (same name
+        with the extension ".npy"), which is memory-mapped by the next reads.
+        The cache is rebuilt when the modification time or the size of 'filename' changes.
+    Return an array of shape (NB_COEFFICIENTS, nb_instruction_types)
+    """
+    cache_filename = os.path.splitext(filename)[0] + '.npy'
+    key_filename = cache_filename + '.key'
+    stat = os.stat(filename)
+    key = '{} {}'.format(stat.st_mtime_ns, stat.st_size)
+
+    # Use the cache if it is up to date
+    try:
+        with open(key_filename, 'r') as _file:
+            if _file.read() == key:
+                return np.load(cache_filename, mmap_mode='r')
+    except (OSError, ValueError):
+        pass
+
+    with open(filename, 'r') as _file:
+        coefficients = np.array([list(map(float, line.split())) for line in _file.readlines()[:NB_COEFFICIENTS]])
+
+    # Update the cache (the key is written last, so it never validates an older cache)
+    try:
+        for path, write in [
+                (cache_filename, lambda _file: np.save(_file, coefficients)),
+                (key_filename, lambda _file: _file.write(key.encode('ascii'))),
+            ]:
+            temp_path = '{}.{}.tmp'.format(path, os.getpid())
+            with open(temp_path, 'wb') as _file:
+                write(_file)
+            os.replace(temp_path, path)
+    except OSError:
+        pass # The cache is optional (the directory can be read-only)
+
+    return coefficients
+
+_coefficients = {}
+
+def get_coefficients(filename=None):
+    """ Return the coefficients of the ELMO model, shared by all the engines of the process
+    :filename: The coefficients file, by default the one of the local installation of ELMO tool
+    """
+    if filename is None:
+        filename = os.path.join(MODULE_PATH, ELMO_TOOL_REPOSITORY, ELMO_COEFFICIENTS_FILE_NAME)
+    if filename not in _coefficients:
+        _coefficients[filename] = read_coefficients(filename)
+    return _coefficients[filename]
+
+### Points
+class PointBuffer:
+    """ Growable array-backed store of the points studied by the ELMO engine
+    Each point is a column of 7 integers: the types of the previous, current
+        and next instructions, the 2 previous operands and the 2 current operands
+    """
+    def __init__(self, capacity=1024):
+        self._data = np.zeros((7, capacity), dtype=np.int64)
+        self._size = 0
+    
+    def __len__(self):
+        return self._size
+    
+    def _reserve(self, nb_points):
+        """ Grow the store (by doubling its capacity) to contain 'nb_points' more points """
+        capacity = self._data.shape[1]
+        if self._size + nb_points <= capacity:
+            return
+        while capacity < self._size + nb_points:
+            capacity *= 2
+        data = np.zeros((7, capacity), dtype=np.int64)
+        data[:,:self._size] = self._data[:,:self._size]
+        self._data = data
+    
+    def append(self, triplet, previous_ops, current_ops):
+        """ Add a single point """
+        self._reserve(1)
+        self._data[:,self._size] = (*triplet, *previous_ops, *current_ops)
+        self._size += 1
+    
+    def extend(self, triplet, previous_ops, current_ops):
+        """ Add the points given as arrays
+        of shapes (3, nb_points), (2, nb_points) and (2, nb_points)
+        """
+        nb_points = triplet.shape[1]
+        self._reserve(nb_points)
+        self._data[0:3,self._size:self._size+nb_points] = triplet
+        self._data[3:5,self._size:self._size+nb_points] = previous_ops
+        self._data[5:7,self._size:self._size+nb_points] = current_ops
+        self._size += nb_points
+    
+    def get(self, start=0, stop=None):
+        """ Return views on the points from 'start' to 'stop' as arrays
+        of shapes (3, nb_points), (2, nb_points) and (2, nb_points)
+        """
+        stop = self._size if stop is None else min(stop, self._size)
+        data = self._data[:,start:stop]
+        return (data[0:3], data[3:5], data[5:7])
+
 class ELMOEngine:
     ### Initialization
-    def __init__(self):
-        self.load_coefficients()
+    def __init__(self, coefficients=None, dtype=np.float64):
+        """ Initialize an ELMO engine
+        :coefficients: If not None, array of the coefficients of the ELMO model
+            to use instead of reading the coefficients file
+        :dtype: Floating-point type of the intermediate arrays and of the computed power.
+            With np.float32, the memory traffic is halved. Compared to np.float64, the power
+            of a point has then an absolute error at most 2^-17 * S, with S the sum of the absolute
+            values of all its contributions (coefficient times bits). It is the worst case of
+            the 78 roundings of 2^-24 on the longest path of the computation: the rounding of the
+            coefficients, the two sums of 32 terms of a bit interaction and the sum of the components.
+        """
+        self.dtype = np.dtype(dtype)
+        self.load_coefficients(coefficients)
         self.reset_points()
     
     def _extract_data(self, nb):
@@ -32,16 +167,13 @@ class ELMOEngine:
         self.pos += nb
         return coeffs
 
-    def load_coefficients(self):
-        """ Load the coefficients for the ELMO model about power leakage """
-        filename = os.path.join(
-            os.path.dirname(os.path.abspath(__file__)),
-            ELMO_TOOL_REPOSITORY,
-            'coeffs.txt',
-        )
-        self.coefficients = None
-        with open(filename, 'r') as _file:
-            self.coefficients = np.array([list(map(float, line.split())) for line in _file.readlines()[:2153]])
+    def load_coefficients(self, coefficients=None):
+        """ Load the coefficients for the ELMO model about power leakage
+        :coefficients: If not None, array of the coefficients to use instead of reading the coefficients file
+        """
+        self.coefficients = coefficients
+        if self.coefficients is None:
+            self.coefficients = get_coefficients()
         
         if self.coefficients is None:
             raise IOError('Problem to read the coefficients.')
@@ -71,125 +203,314 @@ class ELMOEngine:
         self.Operand2_bitinteractions = self._extract_data(496)
         self.BitFlip1_bitinteractions = self._extract_data(496)
         self.BitFlip2_bitinteractions = self._extract_data(496)
+        
+        self.Operand1_bitinteractions_matrix = self._interaction_matrix(self.Operand1_bitinteractions).astype(self.dtype)
+        self.Operand2_bitinteractions_matrix = self._interaction_matrix(self.Operand2_bitinteractions).astype(self.dtype)
+        self.BitFlip1_bitinteractions_matrix = self._interaction_matrix(self.BitFlip1_bitinteractions).astype(self.dtype)
+        self.BitFlip2_bitinteractions_matrix = self._interaction_matrix(self.BitFlip2_bitinteractions).astype(self.dtype)
+        
+        self.build_lookup_tables()
+    
+    def build_lookup_tables(self):
+        """ Precompute the lookup tables of the components of the model
+         - For the components depending only on the instruction types,
+            '<Component>_table[other_type, current_type]' (shape = (6, 6))
+            and 'type_factors[factor, previous_type, current_type, subsequent_type]' (shape = (5, 6, 6, 6))
+            which sums them as 5 factors: the constant part, and the factors of hw_op1, hw_op2, hd_op1 and hd_op2.
+         - For the linear components of the operands,
+            '<Component>_table[type, byte, value]' (shape = (nb_types, 4, 256))
+        The tables are stored in the type of the engine.
+        """
+        self.PrvInstr_table = self._type_table(self.PrvInstr)
+        self.SubInstr_table = self._type_table(self.SubInstr)
+        self.HWOp1PrvInstr_table = self._type_table(self.HWOp1PrvInstr)
+        self.HWOp2PrvInstr_table = self._type_table(self.HWOp2PrvInstr)
+        self.HDOp1PrvInstr_table = self._type_table(self.HDOp1PrvInstr)
+        self.HDOp2PrvInstr_table = self._type_table(self.HDOp2PrvInstr)
+        self.HWOp1SubInstr_table = self._type_table(self.HWOp1SubInstr)
+        self.HWOp2SubInstr_table = self._type_table(self.HWOp2SubInstr)
+        self.HDOp1SubInstr_table = self._type_table(self.HDOp1SubInstr)
+        self.HDOp2SubInstr_table = self._type_table(self.HDOp2SubInstr)
+
+        # Indexes: [previous_type, current_type, subsequent_type]
+        constant = self.constant[np.arange(6) % 5][None, :, None]
+        previous = lambda table: table[:, :, None]
+        subsequent = lambda table: table.T[None, :, :]
+        self.type_factors = np.array([
+            constant + previous(self.PrvInstr_table) + subsequent(self.SubInstr_table),
+            previous(self.HWOp1PrvInstr_table) + subsequent(self.HWOp1SubInstr_table),
+            previous(self.HWOp2PrvInstr_table) + subsequent(self.HWOp2SubInstr_table),
+            previous(self.HDOp1PrvInstr_table) + subsequent(self.HDOp1SubInstr_table),
+            previous(self.HDOp2PrvInstr_table) + subsequent(self.HDOp2SubInstr_table),
+        ]).astype(self.dtype)
+
+        self.Operand1_table = self._byte_table(self.Operand1).astype(self.dtype)
+        self.Operand2_table = self._byte_table(self.Operand2).astype(self.dtype)
+        self.BitFlip1_table = self._byte_table(self.BitFlip1).astype(self.dtype)
+        self.BitFlip2_table = self._byte_table(self.BitFlip2).astype(self.dtype)
+    
+    def _type_table(self, coeffs):
+        """ Return the table (shape = (6, 6)) of a component depending on the type
+        of the current instruction and the type of another (previous or subsequent) instruction
+        The types EOR and OTHER (unprofiled) of the other instruction have no coefficient,
+            and the type OTHER of the current instruction uses the coefficients of EOR
+        """
+        table = np.zeros((6, 6), dtype=self.dtype)
+        table[1:5] = coeffs[:, np.arange(6) % 5]
+        return table
+    
+    def _byte_table(self, coeffs):
+        """ Return the byte-wise lookup table (shape = (nb_types, 4, 256))
+        of the linear component of an operand with the coefficients 'coeffs' (shape = (32, nb_types)):
+            'table[type, byte, value]' is the contribution of the 'byte'-th byte of the operand equal to 'value'
+        """
+        bits = binary_writing(np.arange(256), nb_bits=8) # shape = (8, 256)
+        return np.einsum('bkt,kv->tbv', coeffs.reshape(4, 8, -1), bits)
+    
+    def _interaction_matrix(self, bitinteractions):
+        """ Return the upper-triangular matrices (shape = (nb_types, 32, 32)) of the bit interactions
+        The coefficient of the interaction between the bits i < j is in the cell (i, j)
+        """
+        nb_types = bitinteractions.shape[1]
+        matrix = np.zeros((nb_types, 32, 32))
+        rows, columns = np.triu_indices(32, k=1)
+        matrix[:, rows, columns] = bitinteractions.T
+        return matrix
     
     ### Computation core
     def _dot(self, a, b):
         return np.sum(a * b, axis=0)
         
-    def calculate_point(self, triplet, previous_ops, current_ops, debug=False):
-        nb_points = triplet.shape[1]
-        instructiontype = triplet[CURRENT]
-        instructiontype = instructiontype % 5 # Type 5 = Instruction was not profiled
-                
-        # Previous
-        previous_instruction_typedec = triplet[PREVIOUS]
-        previous_instruction_type = np.zeros((5, nb_points))
-        for i in range(nb_points):
-            if previous_instruction_typedec[i] < 5:
-                previous_instruction_type[previous_instruction_typedec[i],i] = 1
-        
-        # Current
-        (current_op1_binary, hw_op1) = binary_writing(current_ops[0], with_hamming=True)
-        (current_op2_binary, hw_op2) = binary_writing(current_ops[1], with_hamming=True)
-
-        (current_op1_bitflip, hd_op1) = binary_writing(previous_ops[0] ^ current_ops[0], with_hamming=True)
-        (current_op2_bitflip, hd_op2) = binary_writing(previous_ops[1] ^ current_ops[1], with_hamming=True)
-        
-        current_instruction_typedec = instructiontype
-        current_instruction_type = np.zeros((5, nb_points))
-        for i in range(nb_points):
-            if triplet[CURRENT,i] < 5:
-                current_instruction_type[current_instruction_typedec[i],i] = 1
-        
-        # Subsequent
-        subsequent_instruction_typedec = triplet[SUBSEQUENT]
-        subsequent_instruction_type = np.zeros((5, nb_points))
-        for i in range(nb_points):
-            if subsequent_instruction_typedec[i] < 5:
-                subsequent_instruction_type[subsequent_instruction_typedec[i],i] = 1
-
-        # Component variables
-        PrvInstr_data = self._dot( previous_instruction_type[1:], self.PrvInstr[:,instructiontype] )
-        SubInstr_data = self._dot( subsequent_instruction_type[1:], self.SubInstr[:,instructiontype] )
-        
-        Operand1_data = self._dot( current_op1_binary, self.Operand1[:,instructiontype] )
-        Operand2_data = self._dot( current_op2_binary, self.Operand2[:,instructiontype] )
-        BitFlip1_data = self._dot( current_op1_bitflip, self.BitFlip1[:,instructiontype] )
-        BitFlip2_data = self._dot( current_op2_bitflip, self.BitFlip2[:,instructiontype] )
-        
-        HWOp1PrvInstr_data = hw_op1 * self._dot(previous_instruction_type[1:], self.HWOp1PrvInstr[:,instructiontype])
-        HWOp2PrvInstr_data = hw_op2 * self._dot(previous_instruction_type[1:], self.HWOp2PrvInstr[:,instructiontype])
-        HDOp1PrvInstr_data = hd_op1 * self._dot(previous_instruction_type[1:], self.HDOp1PrvInstr[:,instructiontype])
-        HDOp2PrvInstr_data = hd_op2 * self._dot(previous_instruction_type[1:], self.HDOp2PrvInstr[:,instructiontype])
-        HWOp1SubInstr_data = hw_op1 * self._dot(subsequent_instruction_type[1:], self.HWOp1SubInstr[:,instructiontype])
-        HWOp2SubInstr_data = hw_op2 * self._dot(subsequent_instruction_type[1:], self.HWOp2SubInstr[:,instructiontype])
-        HDOp1SubInstr_data = hd_op1 * self._dot(subsequent_instruction_type[1:], self.HDOp1SubInstr[:,instructiontype])
-        HDOp2SubInstr_data = hd_op2 * self._dot(subsequent_instruction_type[1:], self.HDOp2SubInstr[:,instructiontype])
-        
-        Operand1_bitinteractions_data = np.zeros((nb_points))
-        Operand2_bitinteractions_data = np.zeros((nb_points))
-        BitFlip1_bitinteractions_data = np.zeros((nb_points))
-        BitFlip2_bitinteractions_data = np.zeros((nb_points))
-        
-        count = 0
-        for i in range(32):
-            for j in range(i+1,32):
-                Operand1_bitinteractions_data += self.Operand1_bitinteractions[count,instructiontype] * current_op1_binary[i] * current_op1_binary[j]
-                Operand2_bitinteractions_data += self.Operand2_bitinteractions[count,instructiontype] * current_op2_binary[i] * current_op2_binary[j]
-
-                BitFlip1_bitinteractions_data += self.BitFlip1_bitinteractions[count,instructiontype] * current_op1_bitflip[i] * current_op1_bitflip[j]
-                BitFlip2_bitinteractions_data += self.BitFlip2_bitinteractions[count,instructiontype] * current_op2_bitflip[i] * current_op2_bitflip[j]
-
-                count += 1
-                
-        power = self.constant[instructiontype] \
-                    + PrvInstr_data + SubInstr_data \
-                    + Operand1_data + Operand2_data \
-                    + BitFlip1_data + BitFlip2_data \
-                    + HWOp1PrvInstr_data + HWOp2PrvInstr_data \
-                    + HDOp1PrvInstr_data + HDOp2PrvInstr_data \
-                    + HWOp1SubInstr_data + HWOp2SubInstr_data \
-                    + HDOp1SubInstr_data + HDOp2SubInstr_data \
-                    + Operand1_bitinteractions_data + Operand2_bitinteractions_data \
-                    + BitFlip1_bitinteractions_data + BitFlip2_bitinteractions_data
-        
-        for i in range(nb_points):
-            if triplet[CURRENT,i] == 5:
-                power[i] = self.constant[triplet[CURRENT,i]]
-                
+    def _bitinteractions(self, bits, matrix, instructiontype):
+        """ Return the bilinear form 'bits^T . matrix[type] . bits' for each point
+        The points are grouped by instruction type to evaluate it with matrix products
+        """
+        result = np.zeros(bits.shape[1], dtype=self.dtype)
+        for typedec in np.unique(instructiontype):
+            points = (instructiontype == typedec)
+            points_bits = bits[:,points]
+            result[points] = self._dot(matrix[typedec] @ points_bits, points_bits)
+        return result
+    
+    def _linear(self, table, octets, instructiontype):
+        """ Return the linear component of an operand given by its bytes 'octets' (shape = (4, nb_points))
+        using the byte-wise lookup 'table' (see '_byte_table')
+        """
+        return table[instructiontype, 0, octets[0]] + table[instructiontype, 1, octets[1]] \
+            + table[instructiontype, 2, octets[2]] + table[instructiontype, 3, octets[3]]
+        
+    def calculate_point(self, triplet, previous_ops, current_ops, debug=False, components=False, timings=None):
+        """ Compute the power leakage of the points
+        Return a 1D numpy array with an entry for each point
+        :components: If True, return instead a structured array (see 'get_output_dtype')
+            with the contribution of each component of the model and the power of each point
+        :timings: If not None, dictionary where the time spent in each stage of the computation
+            is added (stages: STAGES)
+        """
+        timer = StageTimer(timings)
+        previous_type, current_type, subsequent_type = triplet[PREVIOUS], triplet[CURRENT], triplet[SUBSEQUENT]
+        instructiontype = current_type % 5 # Type 5 = Instruction was not profiled
+        
+        # Operands
+        (current_op1_binary, hw_op1) = binary_writing(current_ops[0], with_hamming=True, dtype=np.uint8)
+        (current_op2_binary, hw_op2) = binary_writing(current_ops[1], with_hamming=True, dtype=np.uint8)
+
+        (current_op1_bitflip, hd_op1) = binary_writing(previous_ops[0] ^ current_ops[0], with_hamming=True, dtype=np.uint8)
+        (current_op2_bitflip, hd_op2) = binary_writing(previous_ops[1] ^ current_ops[1], with_hamming=True, dtype=np.uint8)
+        timer.lap('binary_decomposition')
+        
+        # Linear components of the operands
+        Operand1_data = self._linear(self.Operand1_table, byte_writing(current_ops[0]), instructiontype)
+        Operand2_data = self._linear(self.Operand2_table, byte_writing(current_ops[1]), instructiontype)
+        BitFlip1_data = self._linear(self.BitFlip1_table, byte_writing(previous_ops[0] ^ current_ops[0]), instructiontype)
+        BitFlip2_data = self._linear(self.BitFlip2_table, byte_writing(previous_ops[1] ^ current_ops[1]), instructiontype)
+        timer.lap('linear_terms')
+        
+        # Bit interactions
+        Operand1_bitinteractions_data = self._bitinteractions(current_op1_binary, self.Operand1_bitinteractions_matrix, instructiontype)
+        Operand2_bitinteractions_data = self._bitinteractions(current_op2_binary, self.Operand2_bitinteractions_matrix, instructiontype)
+        BitFlip1_bitinteractions_data = self._bitinteractions(current_op1_bitflip, self.BitFlip1_bitinteractions_matrix, instructiontype)
+        BitFlip2_bitinteractions_data = self._bitinteractions(current_op2_bitflip, self.BitFlip2_bitinteractions_matrix, instructiontype)
+        timer.lap('bit_interactions')
+        
+        unprofiled = (current_type == 5)
+        
+        if not (components or debug):
+            # Components depending only on the instruction types, summed in 5 factors
+            (type_data, hw_op1_factor, hw_op2_factor, hd_op1_factor, hd_op2_factor) = \
+                self.type_factors[:, previous_type, current_type, subsequent_type]
+            
+            power = type_data \
+                        + Operand1_data + Operand2_data \
+                        + BitFlip1_data + BitFlip2_data \
+                        + hw_op1 * hw_op1_factor + hw_op2 * hw_op2_factor \
+                        + hd_op1 * hd_op1_factor + hd_op2 * hd_op2_factor \
+                        + Operand1_bitinteractions_data + Operand2_bitinteractions_data \
+                        + BitFlip1_bitinteractions_data + BitFlip2_bitinteractions_data
+            
+            power[unprofiled] = self.constant[current_type[unprofiled]]
+            timer.lap('type_terms_and_sum')
+            return power
+        
+        # Components depending only on the instruction types, one by one
+        previous = (previous_type, current_type)
+        subsequent = (subsequent_type, current_type)
+        data = np.zeros(triplet.shape[1], dtype=self.get_output_dtype(components=True))
+        data['constant'] = self.constant[instructiontype]
+        data['PrvInstr'] = self.PrvInstr_table[previous]
+        data['SubInstr'] = self.SubInstr_table[subsequent]
+        data['Operand1'], data['Operand2'] = Operand1_data, Operand2_data
+        data['BitFlip1'], data['BitFlip2'] = BitFlip1_data, BitFlip2_data
+        data['HWOp1PrvInstr'] = hw_op1 * self.HWOp1PrvInstr_table[previous]
+        data['HWOp2PrvInstr'] = hw_op2 * self.HWOp2PrvInstr_table[previous]
+        data['HDOp1PrvInstr'] = hd_op1 * self.HDOp1PrvInstr_table[previous]
+        data['HDOp2PrvInstr'] = hd_op2 * self.HDOp2PrvInstr_table[previous]
+        data['HWOp1SubInstr'] = hw_op1 * self.HWOp1SubInstr_table[subsequent]
+        data['HWOp2SubInstr'] = hw_op2 * self.HWOp2SubInstr_table[subsequent]
+        data['HDOp1SubInstr'] = hd_op1 * self.HDOp1SubInstr_table[subsequent]
+        data['HDOp2SubInstr'] = hd_op2 * self.HDOp2SubInstr_table[subsequent]
+        data['Operand1_bitinteractions'] = Operand1_bitinteractions_data
+        data['Operand2_bitinteractions'] = Operand2_bitinteractions_data
+        data['BitFlip1_bitinteractions'] = BitFlip1_bitinteractions_data
+        data['BitFlip2_bitinteractions'] = BitFlip2_bitinteractions_data
+        
         if debug:
-            print([self.constant[instructiontype], \
-                       PrvInstr_data, SubInstr_data, \
-                       Operand1_data, Operand2_data, \
-                       BitFlip1_data, BitFlip2_data, \
-                       HWOp1PrvInstr_data, HWOp2PrvInstr_data, \
-                       HDOp1PrvInstr_data, HDOp2PrvInstr_data, \
-                       HWOp1SubInstr_data, HWOp2SubInstr_data, \
-                       HDOp1SubInstr_data, HDOp2SubInstr_data, \
-                       Operand1_bitinteractions_data, Operand2_bitinteractions_data, \
-                       BitFlip1_bitinteractions_data, BitFlip2_bitinteractions_data])
-        return power
+            print([data[name] for name in COMPONENTS])
+        
+        # The power of an unprofiled instruction is only its constant
+        for name in COMPONENTS:
+            data[name][unprofiled] = 0
+        data['constant'][unprofiled] = self.constant[current_type[unprofiled]]
+        
+        data['power'] = data['constant']
+        for name in COMPONENTS[1:]:
+            data['power'] += data[name]
+        timer.lap('type_terms_and_sum')
+        
+        return data if components else data['power']
+    
+    def get_output_dtype(self, components=False):
+        """ Return the type of the arrays returned by the engine
+        :components: If True, return the structured type of the decomposition in components,
+            with a field for each component of COMPONENTS and a field 'power' for their sum
+        """
+        if components:
+            return np.dtype([(name, self.dtype) for name in COMPONENTS + ('power',)])
+        return self.dtype
     
     ### To manage studied points
     def reset_points(self):
         """ Reset all the points previously added """
-        self.points = []
+        self.points = PointBuffer()
         self.power = None
 
     def add_point(self, triplet, previous_ops, current_ops):
         """ Add a new point to analyse """
-        self.points.append((triplet, previous_ops, current_ops))    
+        self.points.append(triplet, previous_ops, current_ops)
+    
+    def add_points(self, triplet, previous_ops, current_ops):
+        """ Add new points to analyse, given as arrays
+        (see 'compute' for the format of the arguments)
+        """
+        self.points.extend(*self._as_arrays(triplet, previous_ops, current_ops))
         
-    def run(self):
+    def run(self, chunk_size=None, nb_workers=None):
         """ Compute the power leakage of all the points previously added 
         Store the results in 'self.power'
+        :chunk_size: If not None, compute the points by chunks of 'chunk_size' points
+            to bound the memory used by the intermediate arrays
+        :nb_workers: If not None, number of processes sharing the computation (see 'compute')
+        """
+        self.power = self.compute(*self.points.get(), chunk_size=chunk_size, nb_workers=nb_workers)
+    
+    def iter_power(self, chunk_size=ENGINE_CHUNK_SIZE):
+        """ Compute the power leakage of all the points previously added, chunk by chunk
+        Yield a 1D numpy array with the power of each chunk of 'chunk_size' points
+        """
+        for start in range(0, len(self.points), chunk_size):
+            yield self.calculate_point(*self.points.get(start, start+chunk_size))
+    
+    def stream(self, chunks):
+        """ Compute the power leakage of a stream of points, chunk by chunk
+        Only one chunk is in memory at a time, so the stream can be arbitrarily large.
+        Yield a 1D numpy array with the power of each chunk
+        :chunks: Iterable of triplets (triplet, previous_ops, current_ops)
+            (see 'compute' for the format of each chunk)
+        """
+        for triplet, previous_ops, current_ops in chunks:
+            yield self.compute(triplet, previous_ops, current_ops)
+    
+    def _as_arrays(self, triplet, previous_ops, current_ops):
+        triplet = np.asarray(triplet)
+        previous_ops = np.asarray(previous_ops)
+        current_ops = np.asarray(current_ops)
+        if (triplet.ndim != 2) or (triplet.shape[0] != 3):
+            raise ValueError('The instruction types must have a shape (3, nb_points).')
+        if not (previous_ops.shape == current_ops.shape == (2, triplet.shape[1])):
+            raise ValueError('The operands must have a shape (2, nb_points).')
+        if triplet.size and ((triplet.min() < 0) or (triplet.max() >= len(Instruction))):
+            raise ValueError('The instruction types must be between 0 and {}.'.format(len(Instruction)-1))
+        return (triplet, previous_ops, current_ops)
+    
+    def compute(self, triplet, previous_ops, current_ops, chunk_size=None, nb_workers=None, components=False, timings=None):
+        """ Compute the power leakage of points given as arrays, without storing them
+        Return a 1D numpy array with an entry for each point
+        :triplet: Types of the previous, current and next instructions, shape = (3, nb_points)
+        :previous_ops: Operands of the previous instructions, shape = (2, nb_points)
+        :current_ops: Operands of the current instructions, shape = (2, nb_points)
+            Each argument can also be a sequence of 1D arrays, as DataFrame columns.
+        :chunk_size: If not None, compute the points by chunks of 'chunk_size' points
+            to bound the memory used by the intermediate arrays
+        :nb_workers: If not None, number of processes sharing the computation.
+            The points are split into shards of 'chunk_size' points (by default, ENGINE_CHUNK_SIZE)
+            and the power of each shard is written at its position in a shared output array.
+        :components: If True, return instead a structured array (see 'get_output_dtype')
+            with the contribution of each component of the model and the power of each point
+        :timings: If not None, dictionary where the time spent in each stage of the computation
+            is added (see 'calculate_point', not measured with several workers)
         """
-        nb_points = len(self.points)
-        triplet = np.array([p[0] for p in self.points]).T # shape = (3, nb_points)
-        previous_ops = np.array([p[1] for p in self.points]).T # shape = (2, nb_points)
-        current_ops = np.array([p[2] for p in self.points]).T # shape = (2, nb_points)
+        triplet, previous_ops, current_ops = self._as_arrays(triplet, previous_ops, current_ops)
+        nb_points = triplet.shape[1]
+        if nb_workers is not None:
+            return self._compute_parallel(
+                triplet, previous_ops, current_ops,
+                chunk_size or ENGINE_CHUNK_SIZE, nb_workers, components,
+            )
+        if chunk_size is None:
+            return self.calculate_point(triplet, previous_ops, current_ops, components=components, timings=timings)
         
-        self.power = self.calculate_point(triplet, previous_ops, current_ops)
+        power = np.zeros(nb_points, dtype=self.get_output_dtype(components))
+        for start in range(0, nb_points, chunk_size):
+            stop = start + chunk_size
+            power[start:stop] = self.calculate_point(
+                triplet[:,start:stop],
+                previous_ops[:,start:stop],
+                current_ops[:,start:stop],
+                components=components,
+                timings=timings,
+            )
+        return power
+    
+    def _compute_parallel(self, triplet, previous_ops, current_ops, shard_size, nb_workers, components=False):
+        """ Compute the power leakage of the points with a pool of 'nb_workers' processes
+        The coefficients, the points and the output are shared once with the workers
+            thanks to shared memory, the workers only receive the bounds of their shards.
+        """
+        import multiprocessing
+        nb_points = triplet.shape[1]
+
+        coefficients = _SharedArray(self.coefficients)
+        points = _SharedArray(np.concatenate([triplet, previous_ops, current_ops]).astype(np.int64))
+        power = _SharedArray(np.zeros(nb_points, dtype=self.get_output_dtype(components)))
+        
+        shards = [(start, min(start+shard_size, nb_points)) for start in range(0, nb_points, shard_size)]
+        with multiprocessing.Pool(
+            nb_workers,
+            initializer=_init_worker,
+            initargs=(coefficients, self.dtype, points, power, components),
+        ) as pool:
+            pool.map(_compute_shard, shards)
+        return power.array.copy()
     
     def oneshot_point(self, triplet, previous_ops, current_ops):
         """ Compute the power of a single point
@@ -199,3 +520,35 @@ class ELMOEngine:
         self.add_point(triplet, previous_ops, current_ops)
         self.run()
         return self.power
+
+
+### Parallel computation
+class _SharedArray:
+    """ Numpy array stored in shared memory, which can be given to the workers of a pool """
+    def __init__(self, array):
+        import multiprocessing, ctypes
+        self.dtype, self.shape = array.dtype, array.shape
+        self.buffer = multiprocessing.RawArray(ctypes.c_byte, max(array.nbytes, 1))
+        self.array[...] = array
+    
+    @property
+    def array(self):
+        return np.frombuffer(self.buffer, dtype=self.dtype, count=int(np.prod(self.shape))).reshape(self.shape)
+
+_worker = {}
+
+def _init_worker(coefficients, dtype, points, power, components):
+    """ Initialize a worker process with an engine built from the shared coefficients """
+    _worker['engine'] = ELMOEngine(coefficients.array, dtype)
+    _worker['points'] = points.array
+    _worker['power'] = power.array
+    _worker['components'] = components
+
+def _compute_shard(bounds):
+    """ Compute the power of the points between the 'bounds' in a worker process """
+    start, stop = bounds
+    points = _worker['points'][:,start:stop]
+    _worker['power'][start:stop] = _worker['engine'].calculate_point(
+        points[0:3], points[3:5], points[5:7],
+        components=_worker['components'],
+    )
@@ -1,53 +1,92 @@
 import shutil
 import os, re
 import sys
+import time
+import queue
+import itertools
+import threading
+import numpy as np
 
-from .server.servicethread import OneShotServiceThread
+from .server.servicethread import OneShotServiceThread, ListeningThread
+from .server.protocol import JSON_FORMAT, BINARY_FORMAT, PROTOCOL_VERSION
 
 from .config import (
-    MODULE_PATH,
-    ELMO_TOOL_REPOSITORY,
     ELMO_INPUT_FILE_NAME,
     DEFAULT_HOST,
     DEFAULT_PORT,
+    ELMO_SERVER_NB_WORKERS,
+    ELMO_SERVER_MAX_QUEUED_JOBS,
 )
 from .project_base import SimulationProject
-from .manage import execute_simulation
+from .manage import execute_simulation, create_run_directory, set_max_concurrent_runs
 
-from .utils import Color
+from .utils import Color, read_traces
 
 class Executor(OneShotServiceThread):
+    job_id = None # Given by the scheduler of the server (see 'JobScheduler')
+
     def execute(self):
-        """ Answer a request of simulation """
+        """ Answer a request of simulation
+        in an isolated working directory, removed at the end
+        """
+        simulation = SimulationProject()
+        simulation.set_run_directory(create_run_directory())
+        try:
+            self.execute_in(simulation, simulation.get_run_directory())
+        finally:
+            simulation.clean_run_directory()
+
+    def execute_in(self, simulation, run_directory):
+        """ Answer a request of simulation using the working directory 'run_directory' """
         # Get simulation data
-        data = self.protocol.get_data()
-        self.protocol.please_assert(data)
-        
-        elmo_path = os.path.join(MODULE_PATH, ELMO_TOOL_REPOSITORY)
+        request = self.protocol.get_data()
+        self.protocol.please_assert(request)
+        wire_format = request.get('format', JSON_FORMAT)
+        self.protocol.please_assert(wire_format in [JSON_FORMAT, BINARY_FORMAT])
         
         # Set the input of ELMO
-        self.protocol.please_assert('input' in data)
-        with open(os.path.join(elmo_path, ELMO_INPUT_FILE_NAME), 'w') as _input_file:
-            _input_file.write(data['input'])
-        self.protocol.send_ack()
+        self.protocol.please_assert('input' in request)
+        with open(os.path.join(run_directory, ELMO_INPUT_FILE_NAME), 'w') as _input_file:
+            _input_file.write(request['input'])
+        self.protocol.set_version(min(request.get('version', 1), PROTOCOL_VERSION))
+        self.protocol.send_version_ack()
         
-        # Get the binary
-        binary_content = self.protocol.get_file()
-        binary_path = os.path.join(elmo_path, 'project.bin')
-        with open(binary_path, 'wb') as _binary_file:
-            _binary_file.write(binary_content)
+        # Get the binary, streamed to the disk
+        binary_path = os.path.join(run_directory, 'project.bin')
+        self.protocol.get_file(out=binary_path)
         self.protocol.send_ack()
         
         
         ### Generate the traces by launching ELMO
         print(Color.OKGREEN + ' - Simulation accepted...' + Color.ENDC)
-        simulation = SimulationProject()
         simulation.get_binary_path = lambda: os.path.abspath(binary_path)
-        data = execute_simulation(simulation)
+        output_path = os.path.join(run_directory, 'output')
+        get_trace_path = lambda i: os.path.join(output_path, 'traces', 'trace%05d.trc' % i)
+        dtype = request.get('dtype', 'float64')
+
+        # In the stream format, a trace is sent as soon as ELMO starts the next one
+        stream = (wire_format == BINARY_FORMAT) and request.get('stream', False)
+        nb_sent_traces = 0
+        def send_traces(nb_traces):
+            nonlocal nb_sent_traces
+            while nb_sent_traces < nb_traces:
+                nb_sent_traces += 1
+                self.protocol.send_trace(read_traces([get_trace_path(nb_sent_traces)])[0], dtype)
+
+        progress = None
+        if stream:
+            self.protocol.send_stream_header(dtype)
+            progress = lambda nb_traces, elapsed_time: send_traces(nb_traces-1)
+        data = execute_simulation(simulation, progress)
+        if self.job_id is not None:
+            data['job_id'] = self.job_id
         
         if data['error']:
             print(Color.FAIL + ' - Simulation failed.' + Color.ENDC)
-            self.protocol.send_data(results)
+            if stream:
+                self.protocol.send_stream_end(data)
+            else:
+                self.protocol.send_data(data)
             self.protocol.close()
             return
             
@@ -56,16 +95,14 @@ class Executor(OneShotServiceThread):
             data['nb_instructions'],
         ) + Color.ENDC)
 
-        output_path = os.path.join(elmo_path, 'output')
-        
-        ### Get the trace
-        data['results'] = []
-        for i in range(data['nb_traces']):
-            filename = os.path.join(output_path, 'traces', 'trace%05d.trc' % (i+1))
-            with open(filename, 'r') as _file:
-                data['results'].append(
-                    list(map(float,  _file.readlines()))
-                )
+        ### Get the trace, packed in a .npy file which can be sent by the kernel
+        traces_filename = os.path.join(output_path, 'traces.npy')
+        if stream:
+            send_traces(data['nb_traces'])
+        else:
+            read_traces([
+                get_trace_path(i+1) for i in range(data['nb_traces'])
+            ], store_filename=traces_filename)
                 
         ### Get asmtrace and printed data
         asmtrace = None
@@ -79,20 +116,176 @@ class Executor(OneShotServiceThread):
                 data['printed_data'] = list(map(lambda x: int(x, 16), _file.readlines()))
 
         ### Send results
-        print(Color.OKCYAN + ' - Sending results...' + Color.ENDC, end='')
+        print(Color.OKCYAN + ' - Sending results ({})...'.format(wire_format) + Color.ENDC, end='')
         sys.stdout.flush()
-        self.protocol.send_data(data)
-        print(Color.OKGREEN + ' Sent!' + Color.ENDC)
+        if stream:
+            self.protocol.send_stream_end(
+                { key: value for key, value in data.items() if key not in ['asmtrace', 'printed_data'] },
+                data.get('asmtrace'),
+                data.get('printed_data'),
+            )
+            print(Color.OKGREEN + ' Sent!' + Color.ENDC)
+        elif wire_format == BINARY_FORMAT:
+            throughput = self.protocol.send_results(
+                { key: value for key, value in data.items() if key not in ['asmtrace', 'printed_data'] },
+                traces_filename,
+                data.get('asmtrace'),
+                data.get('printed_data'),
+                dtype=dtype,
+            )
+            print(Color.OKGREEN + ' Sent! ({:.1f} MB/s)'.format(throughput / 1e6) + Color.ENDC)
+        else:
+            data['results'] = np.load(traces_filename).tolist()
+            self.protocol.send_data(data)
+            print(Color.OKGREEN + ' Sent!' + Color.ENDC)
         self.protocol.close()
 
 
-def launch_executor(host=DEFAULT_HOST, port=DEFAULT_PORT, waiting_function=True):
-    """ Launch ELMO server on 'host' listening to the 'port' """
-    from .server.servicethread import ListeningThread
+class JobScheduler:
+    """ Queue of jobs treated by a fixed number of worker threads
+    The jobs are treated by increasing priority, then in their order of submission.
+    When 'max_queued_jobs' jobs are waiting, the submission blocks until a job starts (backpressure).
+    The waiting and running times of the jobs are measured (see 'get_statistics').
+    """
+    def __init__(self, nb_workers=ELMO_SERVER_NB_WORKERS, max_queued_jobs=ELMO_SERVER_MAX_QUEUED_JOBS, verbose=False):
+        self.nb_workers = nb_workers
+        self.verbose = verbose
+        self._queue = queue.PriorityQueue(max_queued_jobs)
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._is_stopped = False
+        self._nb_running_jobs = 0
+        self._nb_done_jobs = 0
+        self._waiting_times = []
+        self._running_times = []
+
+        self._workers = [
+            threading.Thread(target=self._work, name='elmo-worker-{}'.format(i+1), daemon=True)
+            for i in range(nb_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, job, priority=0, timeout=None):
+        """ Add a job in the queue
+        Return the id (integer) of the job
+        :job: Function called with the id of the job by a worker
+        :priority: The jobs with the smallest priority are treated first
+        :timeout: Maximal waiting time (in seconds) for a place in the queue,
+            then 'queue.Full' is raised (None to wait without limit)
+        """
+        job_id = next(self._job_ids)
+        self._queue.put((priority, job_id, time.perf_counter(), job), timeout=timeout)
+        if self.verbose:
+            print('[job {}] Queued ({} waiting)'.format(job_id, self._queue.qsize()))
+        return job_id
+
+    def _work(self):
+        while True:
+            try:
+                priority, job_id, submission_time, job = self._queue.get(timeout=1)
+            except queue.Empty:
+                if self._is_stopped:
+                    break
+                continue
+            waiting_time = time.perf_counter() - submission_time
+            with self._lock:
+                self._nb_running_jobs += 1
+                self._waiting_times.append(waiting_time)
+            if self.verbose:
+                print('[job {}] Started after {:.3f} s in the queue'.format(job_id, waiting_time))
+
+            start = time.perf_counter()
+            try:
+                job(job_id)
+            except Exception as err:
+                print(Color.FAIL + '[job {}] Failed: {!r}'.format(job_id, err) + Color.ENDC)
+            running_time = time.perf_counter() - start
+
+            with self._lock:
+                self._nb_running_jobs -= 1
+                self._nb_done_jobs += 1
+                self._running_times.append(running_time)
+            if self.verbose:
+                print('[job {}] Done in {:.3f} s ({} waiting, {} running)'.format(
+                    job_id, running_time, self._queue.qsize(), self._nb_running_jobs,
+                ))
+
+    def get_queue_depth(self):
+        """ Return the number of waiting jobs """
+        return self._queue.qsize()
+
+    def get_statistics(self):
+        """ Return a dictionary with the number of workers, of waiting, running and done jobs,
+        and the mean and maximal waiting and running times of the started jobs (in seconds)
+        """
+        with self._lock:
+            waiting_times = list(self._waiting_times)
+            running_times = list(self._running_times)
+            statistics = {
+                'nb_workers': self.nb_workers,
+                'queue_depth': self._queue.qsize(),
+                'nb_running_jobs': self._nb_running_jobs,
+                'nb_done_jobs': self._nb_done_jobs,
+            }
+        for name, times in [('waiting_time', waiting_times), ('running_time', running_times)]:
+            statistics['mean_' + name] = float(np.mean(times)) if times else None
+            statistics['max_' + name] = max(times) if times else None
+        return statistics
+
+    def stop(self, wait=True):
+        """ Stop the workers once the queued jobs are done
+        :wait: If True, wait for the end of the jobs (and of the cleaning of their working directories)
+        """
+        self._is_stopped = True
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+
+class ExecutorListeningThread(ListeningThread):
+    """ ELMO server: the accepted requests are treated by the workers of a 'JobScheduler'
+    (instead of a thread per connection), at most 'nb_workers' at the same time
+    """
+    def __init__(self, host, port, nb_workers=ELMO_SERVER_NB_WORKERS, max_queued_jobs=ELMO_SERVER_MAX_QUEUED_JOBS, debug=False):
+        super().__init__(host, port, Executor, debug=debug, backlog=max(5, max_queued_jobs))
+        self.scheduler = JobScheduler(nb_workers, max_queued_jobs, verbose=debug)
+
+    def dispatch(self, newthread):
+        def job(job_id):
+            newthread.job_id = job_id
+            newthread.run() # In the worker thread
+
+        while self.is_running():
+            try:
+                self.scheduler.submit(job, timeout=1)
+                return
+            except queue.Full:
+                pass # Backpressure: the next connections wait in the backlog of the socket
+        newthread.clientsocket.close()
+
+    def stop(self):
+        super().stop()
+        self.scheduler.stop(wait=True)
+
+
+def launch_executor(host=DEFAULT_HOST, port=DEFAULT_PORT, waiting_function=True,
+        nb_workers=None, max_queued_jobs=ELMO_SERVER_MAX_QUEUED_JOBS):
+    """ Launch ELMO server on 'host' listening to the 'port'
+    :nb_workers: Number of requests treated at the same time
+        (by default, ELMO_SERVER_NB_WORKERS, and ELMO_MAX_CONCURRENT_RUNS ELMO processes at most)
+    :max_queued_jobs: Maximal number of requests waiting for a worker,
+        beyond the connections wait to be accepted
+    """
+    if nb_workers is not None:
+        set_max_concurrent_runs(nb_workers)
+    else:
+        nb_workers = ELMO_SERVER_NB_WORKERS
         
     def do_main_program():
-        thread = ListeningThread(host, port, Executor, debug=True)
+        thread = ExecutorListeningThread(host, port, nb_workers, max_queued_jobs, debug=True)
         thread.start()
+        thread.is_listening.wait(timeout=10)
         return thread
 
     def program_cleanup(signum, frame):
@@ -108,15 +301,16 @@ def launch_executor(host=DEFAULT_HOST, port=DEFAULT_PORT, waiting_function=True)
     
     # Do somthing during the execution of the server
     if waiting_function is True:
-        import time
         while thread.is_running():
             time.sleep(1)
         return
     
     return_value = None
-    if waiting_function:
-        return_value = waiting_function()
-
-    if thread.is_running():
-        program_cleanup(None, None)    
+    try:
+        if waiting_function:
+            return_value = waiting_function()
+    finally:
+        # Wait for the end of the jobs, to not leave their working directories
+        if thread.is_running():
+            program_cleanup(None, None)    
     return return_value
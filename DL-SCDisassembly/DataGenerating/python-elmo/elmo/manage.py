@@ -1,8 +1,13 @@
 import os, shutil
 import re
+import json
 import inspect
 import subprocess
+import selectors
 import sys
+import time
+import tempfile
+import threading
 from os.path import join as pjoin
 
 from .config import (
@@ -10,80 +15,175 @@ from .config import (
     PROJECTS_REPOSITORY,
     ELMO_TOOL_REPOSITORY,
     ELMO_EXECUTABLE_NAME,
+    ELMO_COEFFICIENTS_FILE_NAME,
+    ELMO_RUN_DIRECTORY,
+    ELMO_MAX_CONCURRENT_RUNS,
     MODULE_PATH,
     ELMO_OUTPUT_ENCODING,
     SEARCH_EXCLUSION_TAG,
+    ELMO_DISCOVERY_INDEX_FILE,
 )
 from .project_base import SimulationProject
 from .utils import Color
 
+############   DISCOVERY INDEX   ############
+# The discovery index remembers, on disk, the project files of each searched repository
+#  (with the modification times of its directories) and the simulation classnames of each
+#  project file (with its modification time and its size). So an unchanged repository is not
+#  walked again, and a project file is executed only if it contains a searched simulation.
+
+_loaded_project_files = {} # Absolute path -> (stat, simulation classes) of the executed project files
+
+def _get_stat(path):
+    """ Return (modification time in ns, size) of the file 'path', or None if it does not exist """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+def load_discovery_index():
+    """ Return the discovery index stored in ELMO_DISCOVERY_INDEX_FILE (empty if it does not exist) """
+    try:
+        with open(ELMO_DISCOVERY_INDEX_FILE, 'r') as _file:
+            index = json.load(_file)
+        if isinstance(index.get('repositories'), dict) and isinstance(index.get('files'), dict):
+            return index
+    except (OSError, ValueError):
+        pass
+    return {'repositories': {}, 'files': {}}
+
+def save_discovery_index(index):
+    """ Store the discovery 'index' in ELMO_DISCOVERY_INDEX_FILE """
+    try:
+        directory = os.path.dirname(ELMO_DISCOVERY_INDEX_FILE)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temp_filename = tempfile.mkstemp(prefix='.discovery-', dir=directory)
+        with os.fdopen(descriptor, 'w') as _file:
+            json.dump(index, _file)
+        os.replace(temp_filename, ELMO_DISCOVERY_INDEX_FILE)
+    except OSError:
+        pass # The index is only an optimization
+
+def list_project_files(repository, index):
+    """ Return the list of the project files ('*project*.py') in the 'repository'
+    The repository is walked only if one of its directories changed since the last walk.
+    :index: Discovery index (updated)
+    """
+    key = os.path.abspath(repository)
+    entry = index['repositories'].get(key)
+    if (entry is not None) and all(
+            _get_stat(directory) == stat for directory, stat in entry['directories'].items()):
+        return [pjoin(repository, filename) for filename in entry['files']]
+
+    directories, filenames = {}, []
+    for root, repositories, files in os.walk(repository):
+        directories[os.path.abspath(root)] = _get_stat(root)
+        for filename in files:
+            if re.fullmatch(r'.*project.*\.py', filename):
+                filenames.append(os.path.relpath(pjoin(root, filename), repository))
+    index['repositories'][key] = {'directories': directories, 'files': filenames}
+    return [pjoin(repository, filename) for filename in filenames]
+
+def get_project_classes(complete_filename, stat=None):
+    """ Execute the project file 'complete_filename' (once while it does not change)
+    Return a dictionary with the 'SimulationProject' subclasses defined in it
+    """
+    stat = stat or _get_stat(complete_filename)
+    key = os.path.abspath(complete_filename)
+    if (key in _loaded_project_files) and (_loaded_project_files[key][0] == stat):
+        return _loaded_project_files[key][1]
+
+    from .utils import write, write_array
+
+    # Encapsulate the project
+    globals = {
+        #'__builtins__': {'__build_class__': __build_class__},
+        'SimulationProject': SimulationProject,
+        'write': write,
+        'write_array': write_array,
+    }
+    locals = {}
+    
+    # Read the project code
+    classes = {}
+    with open(complete_filename, 'r') as _file:
+        project = ''.join(_file.read())
+    if ('SimulationProject' in project) and (SEARCH_EXCLUSION_TAG not in project):
+        exec(project, globals, locals)
+        classes = {key: obj for key, obj in locals.items()
+            if inspect.isclass(obj) and issubclass(obj, SimulationProject)}
+
+    _loaded_project_files[key] = (stat, classes)
+    return classes
+
 ############   GETTERS   ############
 
-def search_simulations_in_repository(repository, criteria=lambda x:True):
+def search_simulations_in_repository(repository, criteria=lambda x:True, classname=None):
     """ Search simulation classes in the 'repository' verifying the 'criteria'
     Return a list of 'SimulationProject' subclasses
     :repository: Repository of the searched simulation classes (string)
     :criteria: Boolean function with 'SimulationProject' subclasses for input
+    :classname: If not None, only the project files defining a simulation with
+        this classname are executed (thanks to the discovery index)
     """
 
     projects = {}
     
-    from .utils import write
-    for root, repositories, files in os.walk(repository):
-        for filename in files:
-            if re.fullmatch(r'.*project.*\.py', filename):
-                complete_filename = pjoin(root, filename)
-
-                # Encapsulate the project
-                globals = {
-                    #'__builtins__': {'__build_class__': __build_class__},
-                    'SimulationProject': SimulationProject,
-                    'write': write,
-                }
-                locals = {}
-                
-                # Read the project code
-                with open(complete_filename, 'r') as _file:
-                    project = ''.join(_file.read())
-                    if ('SimulationProject' not in project) or (SEARCH_EXCLUSION_TAG in project):
-                        continue # Exclude this file
-                    exec(project, globals, locals)
-                
-                # Extract the simulations
-                for key, obj in locals.items():
-                    if inspect.isclass(obj) and issubclass(obj, SimulationProject):
-                        if criteria(obj):
-                            if key in projects:
-                                print(Color.WARNING + \
-                                    'Warning! Many simulations with the same name. ' + \
-                                    'Simulation ignored: {} in {}'.format(
-                                        key, complete_filename[len(repository)+1:]) + \
-                                    Color.ENDC
-                                )
-                            else:
-                                obj.set_project_directory(os.path.abspath(root))
-                                projects[key] = obj
+    index = load_discovery_index()
+    saved_index = json.dumps(index, sort_keys=True)
+    for complete_filename in list_project_files(repository, index):
+        stat = _get_stat(complete_filename)
+        if stat is None:
+            continue
+
+        # Skip the unchanged files without the searched simulations
+        entry = index['files'].get(os.path.abspath(complete_filename))
+        if (entry is not None) and (entry['stat'] == stat):
+            if (not entry['classnames']) or (classname is not None and classname not in entry['classnames']):
+                continue
+
+        classes = get_project_classes(complete_filename, stat)
+        index['files'][os.path.abspath(complete_filename)] = {'stat': stat, 'classnames': list(classes)}
+            
+        # Extract the simulations
+        for key, obj in classes.items():
+            if criteria(obj):
+                if key in projects:
+                    print(Color.WARNING + \
+                        'Warning! Many simulations with the same name. ' + \
+                        'Simulation ignored: {} in {}'.format(
+                            key, complete_filename[len(repository)+1:]) + \
+                        Color.ENDC
+                    )
+                else:
+                    obj.set_project_directory(os.path.abspath(os.path.dirname(complete_filename)))
+                    projects[key] = obj
     
+    if json.dumps(index, sort_keys=True) != saved_index:
+        save_discovery_index(index)
     return projects
 
-def search_simulations_in_module(criteria=lambda x:True):
+def search_simulations_in_module(criteria=lambda x:True, classname=None):
     """ Search simulation classes among the module projects verifying the 'criteria'
     Return a list of 'SimulationProject' subclasses
     :criteria: Boolean function with 'SimulationProject' subclasses for input
+    :classname: If not None, only the simulations with this classname are searched
     """
     projects_path = pjoin(MODULE_PATH, PROJECTS_REPOSITORY)
-    return search_simulations_in_repository(projects_path, criteria)
+    return search_simulations_in_repository(projects_path, criteria, classname)
 
-def search_simulations(repository='.', criteria=lambda x:True):
+def search_simulations(repository='.', criteria=lambda x:True, classname=None):
     """ Search simulation classes in the 'repository' and among
     the module projects verifying the 'criteria'
     Return a list of 'SimulationProject' subclasses
     :repository: Repository of the searched simulation classes (string)
     :criteria: Boolean function with 'SimulationProject' subclasses for input
+    :classname: If not None, only the simulations with this classname are searched
     """
-    projects = search_simulations_in_repository(repository, criteria)
+    projects = search_simulations_in_repository(repository, criteria, classname)
 
-    module_projects = search_simulations_in_module(criteria)
+    module_projects = search_simulations_in_module(criteria, classname)
     for key, project in module_projects.items():
         if key not in projects:
             projects[key] = project
@@ -104,8 +204,9 @@ def get_simulation(classname=None, repository='.'):
     """
     criteria = lambda x: True
     if classname is not None:
-        criteria = lambda x: x.__name__ == classname.strip()    
-    projects = search_simulations(repository, criteria)
+        classname = classname.strip()
+        criteria = lambda x: x.__name__ == classname
+    projects = search_simulations(repository, criteria, classname)
     
     if len(projects) == 1:
         return list(projects.values())[0]
@@ -178,15 +279,99 @@ def create_simulation(repository, classname, is_a_module_project=False):
     return os.path.abspath(project_path)
 
 
+############   RUN DIRECTORIES   ############
+
+_run_slots = threading.BoundedSemaphore(ELMO_MAX_CONCURRENT_RUNS)
+
+def set_max_concurrent_runs(nb_runs):
+    """ Set the maximal number of ELMO processes running at the same time
+    (the other simulations wait for a free slot)
+    :nb_runs: Maximal number of concurrent runs (by default, the number of cores)
+    """
+    global _run_slots
+    _run_slots = threading.BoundedSemaphore(nb_runs)
+
+def create_run_directory(parent_directory=ELMO_RUN_DIRECTORY):
+    """ Create an isolated working directory for one run of ELMO tool:
+    the input, the binary and the output of the run are written in it,
+    so several simulations can run at the same time.
+    Return the absolute path of the created directory
+    :parent_directory: Repository where the working directory is created
+        (by default, the temporary repository of the system)
+    """
+    elmo_path = pjoin(MODULE_PATH, ELMO_TOOL_REPOSITORY)
+    run_directory = tempfile.mkdtemp(prefix='elmo-run-', dir=parent_directory)
+
+    # Same output repositories as in the ELMO tool
+    for root, repositories, files in os.walk(pjoin(elmo_path, 'output')):
+        os.makedirs(pjoin(run_directory, os.path.relpath(root, elmo_path)), exist_ok=True)
+    for repository in ['traces', 'asmoutput']:
+        os.makedirs(pjoin(run_directory, 'output', repository), exist_ok=True)
+
+    # Coefficients of the model, read by ELMO tool in its working directory
+    coefficients_path = pjoin(elmo_path, ELMO_COEFFICIENTS_FILE_NAME)
+    if os.path.isfile(coefficients_path):
+        try:
+            os.symlink(coefficients_path, pjoin(run_directory, ELMO_COEFFICIENTS_FILE_NAME))
+        except OSError:
+            shutil.copy(coefficients_path, run_directory)
+
+    return os.path.abspath(run_directory)
+
+def remove_run_directory(run_directory):
+    """ Remove a working directory created by 'create_run_directory' """
+    shutil.rmtree(run_directory, ignore_errors=True)
+
+
 ############   USAGE FUNCTIONS   ############
 
 class DontFindBinaryError(Exception):
     pass
 
-def execute_simulation(project):
+def follow_process(process, progress=None):
+    """ Read the standard and error outputs of 'process' until it ends,
+    without blocking on one output when the other one is filled
+    Return a couple (output, error) of bytes
+    :progress: If not None, function called as progress(nb_traces, elapsed_time)
+        each time ELMO tool starts a new trace ('TRACE NO' in its output)
+    """
+    start = time.perf_counter()
+    buffers = {process.stdout: bytearray(), process.stderr: bytearray()}
+    nb_traces, line_start = 0, 0
+
+    with selectors.DefaultSelector() as selector:
+        for pipe in buffers:
+            selector.register(pipe, selectors.EVENT_READ)
+        while selector.get_map():
+            for key, _ in selector.select():
+                data = os.read(key.fd, 1 << 16)
+                if not data:
+                    selector.unregister(key.fileobj)
+                    continue
+                buffers[key.fileobj] += data
+
+                # Count the traces in the new complete lines of the standard output
+                output = buffers[process.stdout]
+                if (key.fileobj is process.stdout) and (progress is not None):
+                    line_end = output.rfind(b'\n') + 1
+                    if line_end > line_start:
+                        new_traces = output.count(b'TRACE NO', line_start, line_end)
+                        line_start = line_end
+                        for _ in range(new_traces):
+                            nb_traces += 1
+                            progress(nb_traces, time.perf_counter() - start)
+
+    process.wait()
+    return bytes(buffers[process.stdout]), bytes(buffers[process.stderr])
+
+def execute_simulation(project, progress=None):
     """ Execute a simulation of the power leakage using ELMO tool
+    ELMO tool is launched in the working directory of the project (see 'get_run_directory'),
+        at most ELMO_MAX_CONCURRENT_RUNS at the same time (see 'set_max_concurrent_runs')
     Return the output and the errors of the execution of ELMO tool
     :project: Subclass of 'SimulationProject' defining all the parameters of the simulation
+    :progress: If not None, function called as progress(nb_traces, elapsed_time)
+        each time ELMO tool starts a new trace
     """
     elmo_path = pjoin(MODULE_PATH, ELMO_TOOL_REPOSITORY)
     
@@ -203,31 +388,27 @@ def execute_simulation(project):
     if not os.path.isfile(pjoin(elmo_path, ELMO_EXECUTABLE_NAME)):
         raise Exception('Installation Error: the executable of the ELMO tool is not found.')
     
-    # Launch generation of the traces by launching ELMO
-    command = '{} "{}"'.format(
-        pjoin('.', ELMO_EXECUTABLE_NAME),
-        leaking_binary_path,
-    )
-    process = subprocess.Popen(command, shell=True,
-        cwd=elmo_path, executable='/bin/bash',
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
+    with _run_slots:
+        # Launch generation of the traces by launching ELMO
+        command = '"{}" "{}"'.format(
+            pjoin(elmo_path, ELMO_EXECUTABLE_NAME),
+            leaking_binary_path,
+        )
+        if (progress is not None) and shutil.which('stdbuf'):
+            command = 'stdbuf -oL ' + command # To follow the traces as soon as they are printed
+        process = subprocess.Popen(command, shell=True,
+            cwd=project.get_run_directory(), executable='/bin/bash',
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
     
-    # Follow the generation
-    output, error = b'', b''
-    num_trace = 0
-    while True:
-        output_line = process.stdout.readline()
-        error_line = process.stderr.readline()
-        if (not output_line) and (not error_line) and (process.poll() is not None):
-            break
-        if  error_line:
-            error += error_line
-        if output_line:
-            output += output_line
-            if 'TRACE NO' in output_line.decode(ELMO_OUTPUT_ENCODING):
-                num_trace += 1
-    return_code = process.poll()
+        # Follow the generation
+        try:
+            output, error = follow_process(process, progress)
+        except BaseException:
+            process.kill() # The progress function failed, or interruption
+            process.wait()
+            raise
+        return_code = process.returncode
     
     # Treat data
     output = output.decode(ELMO_OUTPUT_ENCODING) if output else None
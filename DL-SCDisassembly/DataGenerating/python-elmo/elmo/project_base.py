@@ -1,4 +1,6 @@
 import os, re
+import shutil
+import weakref
 import numpy as np
 from os.path import join as pjoin
 
@@ -6,10 +8,17 @@ from .config import (
     MODULE_PATH,
     ELMO_TOOL_REPOSITORY,
     ELMO_INPUT_FILE_NAME,
+    ELMO_STORE_REPOSITORY,
+    ELMO_STORE_TRACES_FILE_NAME,
+    ELMO_STORE_ASMTRACE_FILE_NAME,
+    ELMO_STORE_PRINTED_DATA_FILE_NAME,
+    ELMO_MAX_CONCURRENT_RUNS,
+    ELMO_EXECUTABLE_NAME,
+    ELMO_COEFFICIENTS_FILE_NAME,
     DEFAULT_HOST,
     DEFAULT_PORT,
 )
-from .utils import write
+from .utils import write, write_array, read_traces
 
 class SimulationProject:
     # TAG: EXCLUDE-FROM-SIMULATION-SEARCH
@@ -18,6 +27,7 @@ class SimulationProject:
     """
     _nb_bits_for_nb_challenges = 16
     _project_directory = None
+    _result_cache = None
     
     ### Define the project
     @classmethod
@@ -37,6 +47,19 @@ class SimulationProject:
     def get_binary_path(cl):
         """ Return the path of the leaking binary """
         raise NotImplementedError()
+
+    @classmethod
+    def get_result_cache(cl):
+        """ Return the cache of the results of the simulations (see 'elmo.cache.ResultCache') """
+        if cl._result_cache is None:
+            from .cache import ResultCache
+            SimulationProject._result_cache = ResultCache()
+        return cl._result_cache
+
+    @classmethod
+    def set_result_cache(cl, result_cache):
+        """ Set the cache of the results of the simulations (see 'elmo.cache.ResultCache') """
+        cl._result_cache = result_cache
         
     def get_challenge_format(self):
         """ Return the format of one challenge
@@ -52,17 +75,24 @@ class SimulationProject:
         """
         self.elmo_folder = pjoin(MODULE_PATH, ELMO_TOOL_REPOSITORY)
         self.challenges = challenges
+        self.run_directory = None
+        self._run_directory_finalizer = None
         self.reset()
         
     def reset(self):
         """ Reset the last simulation """
+        self.clean_run_directory()
         self.is_executed = False
         self.has_been_online = False
+        self.is_packed = False
+        self.is_from_cache = False
 
         self._nb_traces = None
         self._complete_asmtrace = None
         self._complete_results = None
         self._complete_printed_data = None
+        self._asmtrace_index = None
+        self._upload_throughput = None
     
     def get_number_of_challenges(self):
         """ Return the number of challenge """
@@ -85,23 +115,100 @@ class SimulationProject:
         self.reset()
         self.challenges = challenges
 
+    def get_run_directory(self):
+        """ Return the path (string) of the working directory of ELMO tool for the last run:
+        an isolated directory created by 'run', or the local installation of ELMO tool
+        """
+        return self.run_directory or self.elmo_folder
+
+    def set_run_directory(self, run_directory):
+        """ Set the working directory of ELMO tool for the next run
+        (created with 'elmo.manage.create_run_directory')
+        It will be removed with the results of the run by 'reset' or 'clean_run_directory'
+        """
+        from .manage import remove_run_directory
+        self.clean_run_directory()
+        self.run_directory = run_directory
+        self._run_directory_finalizer = weakref.finalize(self, remove_run_directory, run_directory)
+
+    def clean_run_directory(self):
+        """ Remove the working directory of the last run, with its results """
+        if self._run_directory_finalizer is not None:
+            self._run_directory_finalizer()
+        self.run_directory = None
+        self._run_directory_finalizer = None
+
     def get_input_filename(self):
         """ Return (string) the path of the input file
-        of the local installation of ELMO tool
+        in the working directory of ELMO tool
         """
-        return pjoin(self.elmo_folder, ELMO_INPUT_FILE_NAME)
+        return pjoin(self.get_run_directory(), ELMO_INPUT_FILE_NAME)
 
     def get_printed_data_filename(self):
         """ Return the path (string) of the file containing the printed data
-        of the local installation of ELMO tool
+        in the working directory of ELMO tool
         """
-        return pjoin(self.elmo_folder, 'output', 'printdata.txt')
+        return pjoin(self.get_run_directory(), 'output', 'printdata.txt')
 
     def get_asmtrace_filename(self):
         """ Return the path (string) of the file containing the ASM trace
-        of the local installation of ELMO tool
+        in the working directory of ELMO tool
+        """
+        return pjoin(self.get_run_directory(), 'output', 'asmoutput', 'asmtrace00001.txt')
+
+    def get_store_directory(self):
+        """ Return the path (string) of the binary store
+        of the results of the last simulation (see 'pack_results')
+        """
+        return pjoin(self.get_run_directory(), 'output', ELMO_STORE_REPOSITORY)
+
+    def get_store_filename(self, filename):
+        """ Return the path (string) of a file of the binary store
+        of the results of the last simulation (see 'pack_results')
+        :filename: Name of the file in the store (see ELMO_STORE_*_FILE_NAME in elmo.config)
         """
-        return pjoin(self.elmo_folder, 'output', 'asmoutput', 'asmtrace00001.txt')
+        return pjoin(self.get_store_directory(), filename)
+
+    def get_cache_key(self, input_data, online=False):
+        """ Return the key of the simulation in the cache of the results:
+        a hash of the leaking binary, of the 'input_data' (string) and,
+        for a local simulation, of the ELMO tool and its coefficients
+        Return None if the binary does not exist
+        """
+        binary_path = self.get_binary_path()
+        if not os.path.isabs(binary_path):
+            binary_path = pjoin(self.get_project_directory(), binary_path)
+        if not os.path.isfile(binary_path):
+            return None
+
+        filenames = [binary_path]
+        if not online:
+            filenames += [
+                filename for filename in [
+                    pjoin(self.elmo_folder, ELMO_EXECUTABLE_NAME),
+                    pjoin(self.elmo_folder, ELMO_COEFFICIENTS_FILE_NAME),
+                ] if os.path.isfile(filename)
+            ]
+        prefix = 'online\n' if online else 'local\n'
+        return self.get_result_cache().get_key(filenames, (prefix + input_data).encode('utf-8'))
+
+    def load_from_cache(self, cache_key, online=False):
+        """ Load the results of the simulation 'cache_key' from the cache of the results
+        Return the raw output of the compiled ELMO tool, or None if it is not in the cache
+        """
+        from .manage import create_run_directory
+        if self.run_directory is None:
+            self.set_run_directory(create_run_directory())
+        res = self.get_result_cache().load(cache_key, self.get_store_directory())
+        if res is None:
+            return None
+
+        self.is_executed = True
+        self.has_been_online = online
+        self.is_packed = True
+        self.is_from_cache = True
+        self._nb_traces = res['nb_traces']
+        return res
     
     def set_input_for_each_challenge(self, input, challenge):
         """ Set the input for one challenge for a simulation with ELMO tool
@@ -119,7 +226,11 @@ class SimulationProject:
                     aux(sizes[1:], data[i])
 
         for num_part in range(len(format)):                
-            aux(format[num_part], challenge[num_part])
+            data = challenge[num_part]
+            if np.shape(data) == tuple(format[num_part]) and np.asarray(data).dtype.kind in 'iub':
+                write_array(input, data) # Bulk conversion of the whole part
+            else:
+                aux(format[num_part], data)
 
     def set_input(self, input):
         """ Set the input for a simulation with ELMO tool
@@ -138,27 +249,171 @@ class SimulationProject:
             for challenge in self.challenges:
                 self.set_input_for_each_challenge(input, challenge)
             
-    def run(self):
+    def run(self, progress=None, use_cache=False):
         """ Run the simulation thanks the local installation of ELMO tool.
         Using the leaking binary defined thanks to the method 'get_binary_path',
             it will run the ELMO tool to output the leaked power traces.
         The results of the simulation are available via the methods:
             'get_results', 'get_traces', 'get_asmtrace' and 'get_printed_data'
+        The simulation runs in its own working directory, so several simulations
+            (with different instances) can run at the same time.
         Return the raw output of the compiled ELMO tool.
+        :progress: If not None, function called as progress(nb_traces, elapsed_time)
+            each time ELMO tool starts a new trace, for example to report the traces per second
+        :use_cache: If True, the results of an identical simulation (same binary and same input)
+            are taken from the cache of the results (see 'get_result_cache') instead of running ELMO tool,
+            and the results of a new simulation are added to the cache.
+            In this case, only the binary store of the results is available (see 'pack_results').
         """
+        from .manage import create_run_directory, execute_simulation
         self.reset()
+        self.set_run_directory(create_run_directory())
         with open(self.get_input_filename(), 'w') as _input:
             self.set_input(_input)
+
+        cache_key = None
+        if use_cache:
+            with open(self.get_input_filename(), 'r') as _input:
+                cache_key = self.get_cache_key(_input.read())
+        if cache_key is not None:
+            res = self.load_from_cache(cache_key)
+            if res is not None:
+                return res
             
-        from .manage import execute_simulation
-        res = execute_simulation(self)
+        res = execute_simulation(self, progress)
         
         self.is_executed = True
         self.has_been_online = False
         self._nb_traces = res['nb_traces']
+        if self._nb_traces:
+            self.pack_results()
+            if cache_key is not None:
+                self.get_result_cache().save(cache_key, self.get_store_directory(), res)
         return res
-        
-    def run_online(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+
+    def run_parallel(self, n_workers=None, shard_size=None, progress=None):
+        """ Run the simulation by splitting the challenges into shards,
+            each shard being simulated by its own ELMO process in an isolated working directory.
+        The results of the shards are merged in the order of the challenges, so they are
+            the same as after 'run' (with the ASM trace of the first trace, as ELMO tool does).
+        It also enables to simulate more challenges than the limit of one run.
+        Return the raw outputs of the compiled ELMO tool, as 'run', for all the shards.
+        :n_workers: Number of shards simulated at the same time (by default, ELMO_MAX_CONCURRENT_RUNS),
+            the number of ELMO processes is also limited by 'elmo.manage.set_max_concurrent_runs'
+        :shard_size: Number of challenges of each shard (by default, the challenges are
+            shared equally between the workers)
+        :progress: If not None, function called as progress(nb_traces, elapsed_time)
+            each time a new trace is started, with the number of traces of all the shards
+        """
+        import copy
+        from concurrent.futures import ThreadPoolExecutor
+        from .manage import create_run_directory
+
+        nb_challenges = self.get_number_of_challenges()
+        if nb_challenges == 0:
+            return self.run()
+
+        self.reset()
+        n_workers = n_workers or ELMO_MAX_CONCURRENT_RUNS
+        max_shard_size = (1 << self._nb_bits_for_nb_challenges) - 1
+        shard_size = shard_size or min(max(-(-nb_challenges // n_workers), 1), max_shard_size)
+        assert 0 < shard_size <= max_shard_size, \
+            'The size of the shards must be between 1 and {}.'.format(max_shard_size)
+
+        shards = []
+        for start in range(0, nb_challenges, shard_size):
+            shard = copy.copy(self)
+            shard.run_directory, shard._run_directory_finalizer = None, None
+            shard.set_challenges(self.challenges[start:start+shard_size])
+            shards.append(shard)
+
+        import threading, time
+        start, lock, nb_started_traces = time.perf_counter(), threading.Lock(), [0]
+        def shard_progress(nb_traces, elapsed_time):
+            with lock:
+                nb_started_traces[0] += 1
+                progress(nb_started_traces[0], time.perf_counter() - start)
+
+        try:
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+                shard_results = list(pool.map(
+                    lambda shard: shard.run(shard_progress if progress is not None else None, use_cache=False),
+                    shards,
+                ))
+
+            for num_shard, (shard, res) in enumerate(zip(shards, shard_results)):
+                if not shard.is_packed:
+                    raise RuntimeError('The simulation of the shard {} failed: {}'.format(num_shard, res['error']))
+
+            self.set_run_directory(create_run_directory())
+            self._merge_shards(shards)
+        finally:
+            for shard in shards:
+                shard.clean_run_directory()
+
+        def concatenate(key, separator):
+            values = [res[key] for res in shard_results if res[key]]
+            return separator.join(values) if values else None
+
+        nb_instructions = [res['nb_instructions'] for res in shard_results]
+        return {
+            'nb_traces': self._nb_traces,
+            'nb_instructions': str(sum(map(int, nb_instructions))) if all(nb_instructions) else None,
+            'output': concatenate('output', ''),
+            'error': concatenate('error', ''),
+        }
+
+    def _merge_shards(self, shards):
+        """ Gather the results of the 'shards' (executed by 'run')
+        in the working directory and in the binary store of the simulation
+        """
+        os.makedirs(self.get_store_directory(), exist_ok=True)
+        self.is_executed = True
+        self.has_been_online = False
+        self._nb_traces = sum(shard.get_number_of_traces() for shard in shards)
+
+        # Text files of the traces, renumbered
+        num_trace = 0
+        for shard in shards:
+            for filename in shard.get_results_filenames():
+                num_trace += 1
+                os.replace(filename, pjoin(self.get_run_directory(), 'output', 'traces', 'trace%05d.trc' % num_trace))
+
+        # Power traces
+        shard_traces = [shard.get_results() for shard in shards]
+        trace_length = shard_traces[0].shape[1]
+        if any(traces.shape[1] != trace_length for traces in shard_traces):
+            raise ValueError('The traces of the shards have different lengths.')
+        traces_filename = self.get_store_filename(ELMO_STORE_TRACES_FILE_NAME)
+        temp_filename = '{}.{}.tmp.npy'.format(traces_filename, os.getpid())
+        traces = np.lib.format.open_memmap(temp_filename, mode='w+', dtype=float, shape=(self._nb_traces, trace_length))
+        traces[:] = np.concatenate(shard_traces) if self._nb_traces else 0.
+        traces.flush()
+        del traces, shard_traces
+        os.replace(temp_filename, traces_filename)
+
+        # ASM trace of the first trace
+        for filename, shard_filename in [
+                (self.get_asmtrace_filename(), shards[0].get_asmtrace_filename()),
+                (self.get_store_filename(ELMO_STORE_ASMTRACE_FILE_NAME), shards[0].get_store_filename(ELMO_STORE_ASMTRACE_FILE_NAME)),
+            ]:
+            if os.path.isfile(shard_filename):
+                shutil.copyfile(shard_filename, filename)
+
+        # Printed data
+        if all(os.path.isfile(shard.get_printed_data_filename()) for shard in shards):
+            with open(self.get_printed_data_filename(), 'wb') as _file:
+                for shard in shards:
+                    with open(shard.get_printed_data_filename(), 'rb') as _shard_file:
+                        shutil.copyfileobj(_shard_file, _file)
+            np.save(
+                self.get_store_filename(ELMO_STORE_PRINTED_DATA_FILE_NAME),
+                np.concatenate([np.asarray(shard.get_printed_data(per_trace=False), dtype=np.int64) for shard in shards]),
+            )
+
+        self.is_packed = True
+
+    def run_online(self, host=DEFAULT_HOST, port=DEFAULT_PORT, use_cache=False, wire_format='binary', dtype='float64'):
         """ Run the simulation thanks to an ELMO server.
         An ELMO server can be launched thanks to the command
             >>> python -m elmo run-server 'host' 'port'
@@ -169,42 +424,131 @@ class SimulationProject:
         Return the raw output of the compiled ELMO tool.
         :host: The host of the ELMO server
         :post! The port where the ELMO server is currently listening
+        :use_cache: If True, the results of an identical simulation (same binary and same input)
+            are taken from the cache of the results (see 'get_result_cache') without contacting the server
+        :wire_format: Format of the results sent by the server: 'binary' (raw traces, compressed ASM trace)
+            or 'json' (for the servers which do not know the binary format, they always answer in JSON)
+        :dtype: Type of the floats of the traces in the binary format ('float64', or 'float32' to halve the transfer)
         """
-        from .server.protocol import SocketTool
+        from .server.protocol import SocketTool, BINARY_FORMAT
         import socket
 
-        class TempInput:
-            def __init__(self):
-                self._buffer = ''
-            def write(self, data):
-                self._buffer += data
-            def get_string(self):
-                return self._buffer
-        
         self.reset()
-        input = TempInput()
-        self.set_input(input)
+        input_string = self._get_input_string()
+
+        cache_key = self.get_cache_key(input_string, online=True) if use_cache else None
+        if cache_key is not None:
+            res = self.load_from_cache(cache_key, online=True)
+            if res is not None:
+                return res
         
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.connect((host, port))
-            SocketTool.send_data(s, {
-                'input': input.get_string(),
-            })
-            if not SocketTool.get_ack(s):
-                raise RuntimeError("NACK received: The request has been refused!")
-            
-            SocketTool.send_file(s, '{}/{}'.format(self.get_project_directory(), self.get_binary_path()))
-            if not SocketTool.get_ack(s):
-                raise RuntimeError("NACK received: The binary file has been refused!")
-            
-            data = SocketTool.get_data(s)
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                length_size = self._send_online_request(s, host, port, {
+                    'input': input_string,
+                    'format': wire_format,
+                    'dtype': dtype,
+                })
+                data = SocketTool.get_data(s, length_size)
+                if data.get('format') == BINARY_FORMAT:
+                    # The traces are received directly in the binary store when it is kept in the cache
+                    traces_filename = None
+                    if cache_key is not None:
+                        os.makedirs(self.get_store_directory(), exist_ok=True)
+                        traces_filename = self.get_store_filename(ELMO_STORE_TRACES_FILE_NAME)
+                    data = SocketTool.get_results(s, data, length_size, traces_filename)
             if data['error']:
                 raise Exception("The simulation returned an error: {}".format(data['error']))
-            s.close()
         except IOError as err:
             raise RuntimeError("The connection refused. Has the ELMO server been switch on?") from err
             
+        res = self._set_online_results(data)
+        if (cache_key is not None) and self._nb_traces:
+            self._write_store()
+            self.get_result_cache().save(cache_key, self.get_store_directory(), res)
+        return res
+
+    def stream_online(self, host=DEFAULT_HOST, port=DEFAULT_PORT, dtype='float64'):
+        """ Run the simulation thanks to an ELMO server (see 'run_online'),
+            receiving the traces while ELMO tool is running.
+        Return an iterator of the power traces (1-dimensional numpy arrays), each one given
+            as soon as ELMO tool has computed it, so the analysis can overlap the simulation.
+        The traces are not kept in the instance: only the ASM trace, the printed data
+            and the number of traces are available at the end of the iteration.
+        With a server which does not know the stream format, the traces are given at the end.
+        :host: The host of the ELMO server
+        :port: The port where the ELMO server is currently listening
+        :dtype: Type of the floats of the traces ('float64', or 'float32' to halve the transfer)
+        """
+        self.reset()
+        return self._receive_stream(host, port, self._get_input_string(), dtype)
+
+    def _receive_stream(self, host, port, input_string, dtype):
+        """ Generator of the traces of the simulation of 'input_string' sent by an ELMO server
+        (see 'stream_online'), the connection is closed when the iteration is stopped
+        """
+        from .server.protocol import SocketTool, BINARY_FORMAT, STREAM_FORMAT
+        import socket
+
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                length_size = self._send_online_request(s, host, port, {
+                    'input': input_string,
+                    'format': BINARY_FORMAT,
+                    'dtype': dtype,
+                    'stream': True,
+                })
+                data = SocketTool.get_data(s, length_size)
+                if data.get('format') == STREAM_FORMAT:
+                    data = yield from SocketTool.get_stream(s, data, length_size)
+                else:
+                    if data.get('format') == BINARY_FORMAT:
+                        data = SocketTool.get_results(s, data, length_size)
+                    yield from np.asarray(data.pop('results', []), dtype=dtype)
+            if data['error']:
+                raise Exception("The simulation returned an error: {}".format(data['error']))
+        except IOError as err:
+            raise RuntimeError("The connection refused. Has the ELMO server been switch on?") from err
+
+        data['results'] = None
+        self._set_online_results(data)
+
+    def _get_input_string(self):
+        """ Return the input of ELMO tool for the simulation (string) """
+        import io
+        input = io.StringIO()
+        self.set_input(input)
+        return input.getvalue()
+
+    def _send_online_request(self, s, host, port, request):
+        """ Connect the socket 's' to an ELMO server, and send the 'request'
+            (dictionary with the input of ELMO tool) and the binary
+        Return the size of the length prefix of the next messages
+        """
+        from .server.protocol import SocketTool, PROTOCOL_VERSION, LENGTH_PREFIX_SIZES
+
+        s.connect((host, port))
+        SocketTool.send_data(s, dict(request, version=PROTOCOL_VERSION))
+        version = SocketTool.get_version_ack(s)
+        if not version:
+            raise RuntimeError("NACK received: The request has been refused!")
+        length_size = LENGTH_PREFIX_SIZES[version]
+        
+        self._upload_throughput = SocketTool.send_file(s, '{}/{}'.format(self.get_project_directory(), self.get_binary_path()), length_size=length_size)
+        if not SocketTool.get_ack(s):
+            raise RuntimeError("NACK received: The binary file has been refused!")
+        return length_size
+
+    def get_upload_throughput(self):
+        """ Return the throughput (in bytes per second) of the sending of the binary
+        to the ELMO server during the last online simulation, or None
+        """
+        return self._upload_throughput
+
+    def _set_online_results(self, data):
+        """ Set the results received from an ELMO server
+        Return the raw output of the compiled ELMO tool
+        """
         self.is_executed = True
         self.has_been_online = True
         self._nb_traces = data['nb_traces']
@@ -216,6 +560,67 @@ class SimulationProject:
             if key not in ['results', 'asmtrace', 'printed_data']
         }
         
+    ### Binary store of the results
+    def pack_results(self, remove_text_traces=False):
+        """ Pack the results of the last local simulation in a binary store:
+            the power traces in a single .npy file, with the ASM trace
+            and the printed data as sidecar files.
+        Then, the results are read from this store, the traces being memory-mapped.
+        It is done by 'run', the text files of ELMO tool are parsed only once.
+        :remove_text_traces: If True, remove the text files of the traces to save disk space
+        """
+        assert self.is_executed
+        assert not self.has_been_online
+        os.makedirs(self.get_store_directory(), exist_ok=True)
+
+        # Power traces, written in a temporary file to never leave a partial store
+        results_filenames = self.get_results_filenames()
+        traces_filename = self.get_store_filename(ELMO_STORE_TRACES_FILE_NAME)
+        temp_filename = '{}.{}.tmp.npy'.format(traces_filename, os.getpid())
+        traces = read_traces(results_filenames, store_filename=temp_filename)
+        del traces # Close the memory map before moving the file
+        os.replace(temp_filename, traces_filename)
+
+        # Sidecars
+        asmtrace_filename = self.get_store_filename(ELMO_STORE_ASMTRACE_FILE_NAME)
+        if os.path.isfile(self.get_asmtrace_filename()):
+            shutil.copyfile(self.get_asmtrace_filename(), asmtrace_filename)
+        elif os.path.isfile(asmtrace_filename):
+            os.remove(asmtrace_filename)
+
+        printed_data_filename = self.get_store_filename(ELMO_STORE_PRINTED_DATA_FILE_NAME)
+        if os.path.isfile(self.get_printed_data_filename()):
+            with open(self.get_printed_data_filename(), 'r') as _file:
+                printed_data = [int(x, 16) for x in _file.read().split()]
+            np.save(printed_data_filename, np.array(printed_data, dtype=np.int64))
+        elif os.path.isfile(printed_data_filename):
+            os.remove(printed_data_filename)
+
+        if remove_text_traces:
+            for filename in results_filenames:
+                os.remove(filename)
+
+        self.is_packed = True
+        self._complete_asmtrace = None
+        self._complete_results = None
+        self._complete_printed_data = None
+        self._asmtrace_index = None
+
+    def _write_store(self):
+        """ Write the results received from an ELMO server in the binary store
+        (the traces may have been received directly in the store, see 'run_online')
+        """
+        os.makedirs(self.get_store_directory(), exist_ok=True)
+        traces_filename = os.path.abspath(self.get_store_filename(ELMO_STORE_TRACES_FILE_NAME))
+        if getattr(self.get_results(), 'filename', None) != traces_filename:
+            np.save(traces_filename, self.get_results())
+        if self._complete_asmtrace is not None:
+            with open(self.get_store_filename(ELMO_STORE_ASMTRACE_FILE_NAME), 'w') as _file:
+                _file.write('\n'.join(self._complete_asmtrace) \
+                    if type(self._complete_asmtrace) is list else self._complete_asmtrace)
+        if self._complete_printed_data is not None:
+            np.save(self.get_store_filename(ELMO_STORE_PRINTED_DATA_FILE_NAME), np.array(self._complete_printed_data, dtype=np.int64))
+
     ### Manipulate the results
     def get_number_of_traces(self):
         """ Get the number of traces of the last simulation """
@@ -228,8 +633,11 @@ class SimulationProject:
         """
         assert self.is_executed
         assert not self.has_been_online
+        if self.is_from_cache:
+            raise RuntimeError('The results have been taken from the cache, without the text files of ELMO tool: '
+                'use the binary store (see \'get_results\'), or run the simulation with \'use_cache=False\'.')
         nb_traces = self.get_number_of_traces()
-        output_path = os.path.join(self.elmo_folder, 'output')
+        output_path = os.path.join(self.get_run_directory(), 'output')
         
         filenames = []
         for i in range(nb_traces):
@@ -241,20 +649,20 @@ class SimulationProject:
     
     def get_results(self):
         """ Get the raw outputs of the last simulation
-        Return a list of power traces (represented by a list of floats)
-        Warning: The output list is the same object stored in the instance.
+        Return a 2-dimensional numpy array of floats, a power trace per row
+        Warning: The output array is the same object stored in the instance.
             If you change this object, it will change in the instance too, and the
             next call to 'get_results' will return the changed object.
         """
         assert self.is_executed
-        nb_traces = self.get_number_of_traces()
 
         # Load the power traces
-        if self._complete_results is None:
-            self._complete_results = []
-            for filename in self.get_results_filenames():
-                with open(filename, 'r') as _file:
-                    self._complete_results.append(list(map(float,  _file.readlines())))
+        if (self._complete_results is None) and self.is_packed:
+            self._complete_results = np.load(self.get_store_filename(ELMO_STORE_TRACES_FILE_NAME), mmap_mode='c')
+        elif self._complete_results is None:
+            self._complete_results = read_traces(self.get_results_filenames())
+        elif not isinstance(self._complete_results, np.ndarray):
+            self._complete_results = np.array(self._complete_results, dtype=float)
 
         return self._complete_results
     
@@ -269,20 +677,10 @@ class SimulationProject:
         assert self.is_executed
         results = self.get_results()
 
-        nb_traces = self.get_number_of_traces()
-        trace_length = len(results[0])
-        
         if indexes is None:
-            traces = np.zeros((nb_traces, trace_length))
-            for i in range(nb_traces):
-                traces[i,:] = results[i]
-            return traces
-        
+            return np.array(results)
         else:
-            traces = np.zeros((nb_traces, len(indexes)))
-            for i in range(nb_traces):
-                traces[i,:] = np.array(results[i])[indexes]
-            return traces
+            return results[:, indexes]
 
     ### Manipulate the ASM trace
     def get_asmtrace(self):
@@ -294,7 +692,9 @@ class SimulationProject:
         
         # Load the ASM trace
         if self._complete_asmtrace is None:
-            with open(self.get_asmtrace_filename(), 'r') as _file:
+            filename = self.get_store_filename(ELMO_STORE_ASMTRACE_FILE_NAME) \
+                if self.is_packed else self.get_asmtrace_filename()
+            with open(filename, 'r') as _file:
                 self._complete_asmtrace = _file.read()        
         if type(self._complete_asmtrace) is not list:
             self._complete_asmtrace = self._complete_asmtrace.split('\n')   
@@ -307,7 +707,25 @@ class SimulationProject:
         :condition: Boolean function with ASM instruction (string) for input
         """
         assert self.is_executed
-        return [i for i, instr in enumerate(self.get_asmtrace()) if condition(instr)]
+        return self.get_asmtrace_index().get_indexes_of(condition).tolist()
+
+    def get_asmtrace_index(self):
+        """ Get the index of the ASM trace of the last simulation (see 'elmo.asmtrace.AsmTraceIndex'),
+        built once, to query the positions of the instructions with numpy arrays
+        """
+        assert self.is_executed
+        if self._asmtrace_index is None:
+            from .asmtrace import AsmTraceIndex
+            self._asmtrace_index = AsmTraceIndex(self.get_asmtrace())
+        return self._asmtrace_index
+
+    def get_instruction_indexes(self, mnemonics, start=None, stop=None):
+        """ Get the array of indexes of the instructions with one of the 'mnemonics'
+        in the ASM trace, between the indexes 'start' (included) and 'stop' (excluded)
+        The result can be given to 'get_traces'
+        :mnemonics: A mnemonic (string, as 'muls') or a list of mnemonics
+        """
+        return self.get_asmtrace_index().get_positions(mnemonics, start, stop)
 
     ### Manipulate the Printed Data
     def get_printed_data(self, per_trace=True):
@@ -320,7 +738,9 @@ class SimulationProject:
         assert self.is_executed
         
         # Load the printed data
-        if self._complete_printed_data is None:
+        if (self._complete_printed_data is None) and self.is_packed:
+            self._complete_printed_data = np.load(self.get_store_filename(ELMO_STORE_PRINTED_DATA_FILE_NAME)).tolist()
+        elif self._complete_printed_data is None:
             with open(self.get_printed_data_filename(), 'r') as _file:
                 self._complete_printed_data = list(map(lambda x: int(x, 16), _file.readlines()))
         
@@ -2,6 +2,8 @@
 ###  - This class must be inherited from th class 'SimulationProject' (no need to import it)
 ###  - You can use here the function "write(input_file, uint, nb_bits=16)"
 ###            to write an integer of 'nb_bits' bits in the 'input_file' (no need to import it too).
+###  - and the function "write_array(input_file, uint_array, nb_bits=16)"
+###            to write all the integers of a numpy array in one call (no need to import it too).
 ### To get this simulation class in Python scripts, please use the functions in manage.py as
 ###  - search_simulations(repository)
 ###  - get_simulation(repository, classname=None)
@@ -28,10 +30,8 @@ class KyberNTTSimulation(SimulationProject):
                 the 'challenge' for the simulation """
         secret = challenge
 
-        # Write the secret vector
-        for j in range(self.KYBER_K):
-            for k in range(self.KYBER_N):
-                write(input, secret[j,k])
+        # Write the secret vector (coefficients of each polynomial in a row)
+        write_array(input, secret)
                 
     def get_test_challenges(self):
         import numpy as np
@@ -1,76 +1,295 @@
 import os
+import time
 import json
+import zlib
+import numpy as np
 
 
 class ClosureException(Exception):
    pass
 
 
+# Formats of the results sent by the ELMO server
+JSON_FORMAT = 'json' # Everything in a JSON object (traces as lists of floats)
+BINARY_FORMAT = 'binary' # JSON header, then raw blocks (see 'SocketTool.send_results')
+STREAM_FORMAT = 'stream' # Traces sent while ELMO is running (see 'SocketTool.send_stream_header')
+BINARY_HEADER_KEYS = ['format', 'dtype', 'shape', 'has_asmtrace', 'has_printed_data']
+
+
+# Versions of the protocol, with the size (in bytes) of the length prefix of the messages
+# The request of a simulation is always sent with a 4-byte prefix, with the version of the client,
+#   and the server answers with the version used for the rest of the exchange (see 'send_version_ack')
+PROTOCOL_VERSION = 2
+LENGTH_PREFIX_SIZES = {
+    1: 4, # Messages up to 4 GB
+    2: 8,
+}
+
+RECEIVING_CHUNK_SIZE = 1024*1024
+
+
+def read_npy_header(_file):
+    """ Read the header of the .npy file object '_file', which is then at the beginning of the data
+    Return a tuple (shape, fortran_order, dtype)
+    """
+    version = np.lib.format.read_magic(_file)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(_file)
+    return np.lib.format.read_array_header_2_0(_file)
+
+
 # https://stackoverflow.com/questions/20007319/how-to-do-a-large-text-file-transfer-in-python
 
 class SocketTool:
     @classmethod
-    def convert_to_bytes(cl, no):
-        result = bytearray()
-        result.append(no & 255)
-        for i in range(3):
-            no = no >> 8
-            result.append(no & 255)
-        return result
+    def convert_to_bytes(cl, no, length_size=4):
+        return no.to_bytes(length_size, 'little')
 
     @classmethod
     def bytes_to_number(cl, b):
-        import sys
-        b = b if (sys.version_info > (3, 0)) else map(ord, b)
-        
-        res = 0
-        for i in range(4):
-            res += b[i] << (i*8)
-        return res        
+        return int.from_bytes(b, 'little')
         
     @classmethod
-    def send_file(cl, s, filename, mode='rb'):
+    def send_stream(cl, s, _file, count):
+        """ Send 'count' bytes of the binary file object '_file' from its current position,
+        copied by the kernel (os.sendfile) when possible, else with a loop of 'sendall'
+        """
+        if count <= 0:
+            return
+        if hasattr(s, 'sendfile'):
+            s.sendfile(_file, _file.tell(), count) # Falls back on 'send' by itself if needed
+            return
+        while count > 0:
+            d = _file.read(min(1024*64, count)) # We send by pack of 64 ko
+            if not d:
+                break
+            s.sendall(d)
+            count -= len(d)
+
+    @classmethod
+    def send_file(cl, s, filename, mode='rb', length_size=4):
+        """ Send the content of the file 'filename'
+        Return the throughput of the sending (in bytes per second)
+        """
         length = os.path.getsize(filename)
-        s.send(cl.convert_to_bytes(length)) # has to be 4 bytes
+        start = time.perf_counter()
+        s.sendall(cl.convert_to_bytes(length, length_size))
         with open(filename, mode) as infile:
-            d = infile.read(1024*64) # We send by pack of 64 ko
-            while d:
-                s.send(d)
-                d = infile.read(1024*64)
+            cl.send_stream(s, infile, length)
+        return length / max(time.perf_counter() - start, 1e-9)
 
     @classmethod
-    def get_file(cl, s):
-        size = s.recv(4) # assuming that the size won't be bigger then 1GB
-        size = cl.bytes_to_number(size)
+    def recv_into(cl, s, buffer):
+        """ Fill the 'buffer' (writable bytes-like object) with the data received from the socket 's'
+        Return the number of received bytes, smaller than the size of the buffer if the connection is closed
+        """
+        view = memoryview(buffer).cast('B')
         current_size = 0
-        buffer = b''
-        while current_size < size:
-            data = s.recv(1024*64)
-            if not data:
+        while current_size < len(view):
+            size = s.recv_into(view[current_size:])
+            if not size:
                 break
-            if len(data) + current_size > size:
-                data = data[:size-current_size] # trim additional data
-            buffer += data
-            # you can stream here to disk
-            current_size += len(data)
-        # you have entire file in memory
-        return buffer
+            current_size += size
+        return current_size
+
+    @classmethod
+    def recv_exactly(cl, s, size):
+        buffer = bytearray(size)
+        return buffer[:cl.recv_into(s, buffer)]
+
+    @classmethod
+    def get_file(cl, s, length_size=4, out=None):
+        """ Receive a message (bytes prefixed by their length on 'length_size' bytes)
+        Return a bytearray with the content of the message, received without intermediate copies
+        :out: If not None, the content is written in 'out' instead of being returned:
+            if it is a filename, the content is streamed to this file by chunks of 1 MB,
+            else it must be a writable buffer of the size of the message (as a memory-mapped array)
+            Then, return the number of received bytes.
+        """
+        size = cl.bytes_to_number(cl.recv_exactly(s, length_size))
+        if out is None:
+            buffer = bytearray(size)
+            current_size = cl.recv_into(s, buffer)
+            return buffer if current_size == size else buffer[:current_size]
+
+        if not isinstance(out, str):
+            assert memoryview(out).nbytes == size, 'The buffer does not have the size of the message'
+            return cl.recv_into(s, out)
+
+        current_size = 0
+        buffer = memoryview(bytearray(min(size, RECEIVING_CHUNK_SIZE)))
+        with open(out, 'wb') as _file:
+            while current_size < size:
+                wanted_size = min(len(buffer), size-current_size)
+                chunk_size = cl.recv_into(s, buffer[:wanted_size])
+                _file.write(buffer[:chunk_size])
+                current_size += chunk_size
+                if chunk_size < wanted_size:
+                    break # Connection closed
+        return current_size
         
     @classmethod
-    def send_data(cl, s, data):
+    def send_bytes(cl, s, data, length_size=4):
+        data = memoryview(data).cast('B')
+        s.sendall(cl.convert_to_bytes(len(data), length_size))
+        for i in range(0, len(data), 1024*64):
+            s.sendall(data[i:i+1024*64])
+        return len(data)
+
+    @classmethod
+    def send_data(cl, s, data, length_size=4):
         data = json.dumps(data)
         data = data.encode('utf-8')
-        s.send(cl.convert_to_bytes(len(data))) # has to be 4 bytes
-        for i in range(0, len(data), 1024*64):
-            s.send(data[i:i+1024*64])
+        return cl.send_bytes(s, data, length_size)
+
+    @classmethod
+    def send_npy_file(cl, s, filename, dtype, length_size=4):
+        """ Send the data of the .npy file 'filename' as raw block of type 'dtype' (see 'send_bytes')
+        The file is sent without being loaded if its data have already this type, else it is converted
+        Return the number of sent bytes
+        """
+        with open(filename, 'rb') as _file:
+            shape, fortran_order, file_dtype = read_npy_header(_file)
+            if (file_dtype == dtype) and not fortran_order:
+                length = file_dtype.itemsize * int(np.prod(shape))
+                s.sendall(cl.convert_to_bytes(length, length_size))
+                cl.send_stream(s, _file, length)
+                return length
+        traces = np.load(filename, mmap_mode='r')
+        return cl.send_bytes(s, np.ascontiguousarray(traces, dtype=dtype).reshape(-1), length_size)
+
+    @classmethod
+    def send_results(cl, s, data, traces, asmtrace=None, printed_data=None, dtype='float64', length_size=4):
+        """ Send the results of a simulation in the binary format: a JSON header with the entries
+        of 'data' and the description of the blocks, then a block with the 'traces' as raw
+        little-endian floats of type 'dtype', a block with the 'asmtrace' (string) compressed with zlib,
+        and a block with the 'printed_data' as little-endian 64-bit integers
+        Return the throughput of the sending (in bytes per second)
+        :traces: Numpy array of the traces, or filename of a .npy file (sent by the kernel if possible)
+        """
+        start = time.perf_counter()
+        dtype = np.dtype(dtype).newbyteorder('<')
+        if isinstance(traces, str):
+            with open(traces, 'rb') as _file:
+                shape = read_npy_header(_file)[0]
+        else:
+            traces = np.ascontiguousarray(traces, dtype=dtype)
+            shape = traces.shape
+        header = dict(data,
+            format=BINARY_FORMAT,
+            dtype=dtype.str,
+            shape=list(shape),
+            has_asmtrace=(asmtrace is not None),
+            has_printed_data=(printed_data is not None),
+        )
+        length = cl.send_data(s, header, length_size)
+        if isinstance(traces, str):
+            length += cl.send_npy_file(s, traces, dtype, length_size)
+        else:
+            length += cl.send_bytes(s, traces.reshape(-1), length_size)
+        length += cl.send_extra_results(s, asmtrace, printed_data, length_size)
+        return length / max(time.perf_counter() - start, 1e-9)
+
+    @classmethod
+    def send_extra_results(cl, s, asmtrace=None, printed_data=None, length_size=4):
+        """ Send the blocks of the 'asmtrace' and of the 'printed_data' (see 'send_results')
+        Return the number of sent bytes
+        """
+        length = 0
+        if asmtrace is not None:
+            length += cl.send_bytes(s, zlib.compress(asmtrace.encode('utf-8')), length_size)
+        if printed_data is not None:
+            length += cl.send_bytes(s, np.asarray(printed_data, dtype='<i8'), length_size)
+        return length
+
+    @classmethod
+    def get_extra_results(cl, s, header, length_size=4):
+        """ Receive the blocks described by the 'header' (see 'send_extra_results')
+        Return a couple (asmtrace, printed_data), None for a block which is not sent
+        """
+        asmtrace = zlib.decompress(cl.get_file(s, length_size)).decode('utf-8') if header['has_asmtrace'] else None
+        printed_data = np.frombuffer(cl.get_file(s, length_size), dtype='<i8').tolist() if header['has_printed_data'] else None
+        return asmtrace, printed_data
+
+    @classmethod
+    def send_stream_header(cl, s, dtype='float64', length_size=4):
+        """ Start the sending of the results of a simulation in the stream format:
+        a JSON header, then a block per trace as raw little-endian floats of type 'dtype' (see 'send_trace'),
+        sent while ELMO is running, an empty block, and the end of the results (see 'send_stream_end')
+        """
+        cl.send_data(s, {'format': STREAM_FORMAT, 'dtype': np.dtype(dtype).newbyteorder('<').str}, length_size)
+
+    @classmethod
+    def send_trace(cl, s, trace, dtype='float64', length_size=4):
+        """ Send a non-empty 'trace' in the stream format """
+        cl.send_bytes(s, np.ascontiguousarray(trace, dtype=np.dtype(dtype).newbyteorder('<')), length_size)
+
+    @classmethod
+    def send_stream_end(cl, s, data, asmtrace=None, printed_data=None, length_size=4):
+        """ End the sending in the stream format: an empty block, a JSON header with
+        the entries of 'data', and the blocks of the 'asmtrace' and of the 'printed_data'
+        """
+        cl.send_bytes(s, b'', length_size)
+        cl.send_data(s, dict(data,
+            has_asmtrace=(asmtrace is not None),
+            has_printed_data=(printed_data is not None),
+        ), length_size)
+        cl.send_extra_results(s, asmtrace, printed_data, length_size)
+
+    @classmethod
+    def get_stream(cl, s, header, length_size=4):
+        """ Receive the results in the stream format described by the 'header' (see 'send_stream_header')
+        Generator of the traces (1-dimensional numpy arrays), as soon as they are received
+        Return the entries of the last header with the entries 'asmtrace' (string) and 'printed_data' (list of integers)
+        """
+        while True:
+            trace = cl.get_file(s, length_size)
+            if not trace:
+                break
+            yield np.frombuffer(trace, dtype=header['dtype'])
+
+        end_header = cl.get_data(s, length_size)
+        if end_header is None:
+            raise ConnectionError('The connection has been closed while receiving the traces')
+        data = {key: value for key, value in end_header.items() if key not in BINARY_HEADER_KEYS}
+        data['asmtrace'], data['printed_data'] = cl.get_extra_results(s, end_header, length_size)
+        return data
+
+    @classmethod
+    def get_results(cl, s, header, length_size=4, traces_filename=None):
+        """ Receive the blocks of results described by the 'header' (see 'send_results')
+        Return the entries of the header with the entries 'results' (numpy array of the traces),
+            'asmtrace' (string) and 'printed_data' (list of integers)
+        :traces_filename: If not None, the traces are received directly in this .npy file
+            (memory-mapped, the memory used does not depend on the number of traces)
+        """
+        data = {key: value for key, value in header.items() if key not in BINARY_HEADER_KEYS}
+        dtype, shape = np.dtype(header['dtype']), tuple(header['shape'])
+        if (traces_filename is None) or (not np.prod(shape)):
+            traces = cl.get_file(s, length_size)
+            size = len(traces)
+            data['results'] = np.frombuffer(traces, dtype=dtype)
+        else:
+            from numpy.lib.format import open_memmap
+            traces = open_memmap(traces_filename, mode='w+', dtype=dtype, shape=shape)
+            size = cl.get_file(s, length_size, traces.reshape(-1))
+            traces.flush()
+            del traces # Close the memory map before opening it again without writing access
+            data['results'] = np.load(traces_filename, mmap_mode='c')
+        if size != dtype.itemsize * int(np.prod(shape)):
+            raise ConnectionError('The connection has been closed while receiving the traces')
+
+        data['results'] = data['results'].reshape(shape)
+        data['asmtrace'], data['printed_data'] = cl.get_extra_results(s, header, length_size)
+        return data
         
     @classmethod
-    def get_data(cl, s):
+    def get_data(cl, s, length_size=4):
         import sys
         exception_class = json.decoder.JSONDecodeError if (sys.version_info > (3, 0)) else ValueError
 
         try:
-            data = cl.get_file(s)
+            data = cl.get_file(s, length_size)
             data = data.decode('utf-8')
             data = json.loads(data)
             return data
@@ -80,29 +299,58 @@ class SocketTool:
     @classmethod
     def send_ack(cl, s, positive=True):
         data = 'OK' if positive else 'NO'
-        s.send(data.encode('ascii'))
+        s.sendall(data.encode('ascii'))
 
     @classmethod
     def get_ack(cl, s):
         data = s.recv(2).decode('ascii')
         return (data == 'OK')
 
+    @classmethod
+    def send_version_ack(cl, s, version):
+        """ Accept a request, giving the 'version' of the protocol for the rest of the exchange
+        The version 1 is acknowledged by 'OK', as for the clients which do not give their version
+        """
+        data = 'OK' if version == 1 else 'V{}'.format(version)
+        s.sendall(data.encode('ascii'))
+
+    @classmethod
+    def get_version_ack(cl, s):
+        """ Return the version of the protocol accepted by the server, or 0 if the request is refused """
+        data = cl.recv_exactly(s, 2).decode('ascii')
+        if data == 'OK':
+            return 1
+        if data[:1] == 'V' and data[1:].isdigit():
+            return int(data[1:])
+        return 0
+
 
 class Protocol:
     def __init__(self, clientsocket):
         self.clientsocket = clientsocket
+        self.version = 1
+
+    def set_version(self, version):
+        """ Use the 'version' of the protocol for the next messages """
+        self.version = version
+
+    def get_length_size(self):
+        return LENGTH_PREFIX_SIZES[self.version]
     
     def send_file(self, filename, mode='rb'):
-        SocketTool.send_file(self.clientsocket, filename, mode)
+        return SocketTool.send_file(self.clientsocket, filename, mode, self.get_length_size())
     
-    def get_file(self):
-        return SocketTool.get_file(self.clientsocket)
+    def get_file(self, out=None):
+        return SocketTool.get_file(self.clientsocket, self.get_length_size(), out)
         
     def send_data(self, data):
-        SocketTool.send_data(self.clientsocket, data)
+        SocketTool.send_data(self.clientsocket, data, self.get_length_size())
+
+    def send_results(self, data, traces, asmtrace=None, printed_data=None, dtype='float64'):
+        return SocketTool.send_results(self.clientsocket, data, traces, asmtrace, printed_data, dtype, self.get_length_size())
     
     def get_data(self):
-        return SocketTool.get_data(self.clientsocket)
+        return SocketTool.get_data(self.clientsocket, self.get_length_size())
         
     def send_ack(self, positive=True):
         SocketTool.send_ack(self.clientsocket, positive)
@@ -110,6 +358,18 @@ class Protocol:
     def send_nack(self, positive=True):
         SocketTool.send_ack(self.clientsocket, not positive)
 
+    def send_stream_header(self, dtype='float64'):
+        SocketTool.send_stream_header(self.clientsocket, dtype, self.get_length_size())
+
+    def send_trace(self, trace, dtype='float64'):
+        SocketTool.send_trace(self.clientsocket, trace, dtype, self.get_length_size())
+
+    def send_stream_end(self, data, asmtrace=None, printed_data=None):
+        SocketTool.send_stream_end(self.clientsocket, data, asmtrace, printed_data, self.get_length_size())
+
+    def send_version_ack(self):
+        SocketTool.send_version_ack(self.clientsocket, self.version)
+
     def get_ack(self):
         return SocketTool.get_ack(self.clientsocket)
         
@@ -44,13 +44,15 @@ class PermanentServiceThread(ServiceThread):
 
 
 class ListeningThread(PermanentServiceThread):
-    def __init__(self, host, port, threadclass, debug=False, **kwargs):
+    def __init__(self, host, port, threadclass, debug=False, backlog=5, **kwargs):
         super().__init__()
         self.hostname = host
         self.port = port
         self.threadclass = threadclass
         self.kwargs = kwargs
         self.debug = debug
+        self.backlog = backlog
+        self.is_listening = threading.Event() # Set when the connections can be accepted
     
     def execute(self):
         self.tcpsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -58,7 +60,8 @@ class ListeningThread(PermanentServiceThread):
         self.tcpsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         # self.tcpsock.setsockopt(socket.SOL_SOCKET, socket.SO_ATTACH_REUSEPORT_CBPF, 1)
         self.tcpsock.bind((self.hostname, self.port))
-        self.tcpsock.listen(5)
+        self.tcpsock.listen(self.backlog)
+        self.is_listening.set()
         
         if self.debug:
             print('[port][%s] Listening' % self.port)
@@ -74,7 +77,7 @@ class ListeningThread(PermanentServiceThread):
                             clientsocket.getpeername(),
                         ))
                     newthread = self.threadclass(ip, port, clientsocket, **self.kwargs)
-                    newthread.start()
+                    self.dispatch(newthread)
                 else:
                     break
             except socket.timeout:
@@ -82,6 +85,10 @@ class ListeningThread(PermanentServiceThread):
 
         print('[port][%s] Stop listening' % self.port)
 
+    def dispatch(self, newthread):
+        # Method where the service of an accepted connection is launched
+        newthread.start()
+
     def stop(self):
         super().stop()
         clientsocker = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -1,3 +1,4 @@
+import time
 import numpy as np
 
 ### Binary operations
@@ -13,12 +14,16 @@ def hdistance(x,y):
     """ Return the Hamming distance between 'x' and 'y' """
     return hweight(x^y)
 
-def binary_writing(n, nb_bits=32, with_hamming=False):
+def binary_writing(n, nb_bits=32, with_hamming=False, dtype=float):
     """ Return the binary writing 'w' of 'n' with 'nb_bits'
     If with_hamming is True, return a couple (w, h) with 'h' the Hamming weight of 'n'
+    :dtype: Type of the returned arrays, np.uint8 gives a compact bit matrix
     """
     n = np.array(n)
-    w, h = np.zeros((nb_bits, len(n))), np.zeros((len(n)))
+    if nb_bits <= 64:
+        return _binary_writing_unpacked(n, nb_bits, with_hamming, dtype)
+
+    w, h = np.zeros((nb_bits, len(n)), dtype=dtype), np.zeros((len(n)), dtype=dtype)
 
     for ind in range(nb_bits):
         w[ind] = (n & 1)
@@ -28,7 +33,30 @@ def binary_writing(n, nb_bits=32, with_hamming=False):
         ind += 1
     
     return (w, h) if with_hamming else w
-    
+
+def byte_writing(n, nb_bytes=4):
+    """ Return the little-endian bytes of 'n' (shape = (nb_bytes, len(n)), type = np.uint8) """
+    values = np.array(n).reshape(-1).astype('<u{}'.format(nb_bytes))
+    return np.ascontiguousarray(values.view(np.uint8).reshape(-1, nb_bytes).T)
+
+def _binary_writing_unpacked(n, nb_bits, with_hamming, dtype):
+    """ Bit-parallel version of 'binary_writing' for at most 64 bits:
+    the values are viewed as little-endian bytes and unpacked with 'np.unpackbits'
+    """
+    nb_bytes = next(size for size in (1, 2, 4, 8) if 8*size >= nb_bits)
+    values = n.reshape(-1).astype('<u{}'.format(nb_bytes))
+    octets = byte_writing(values, nb_bytes)
+    bits = np.unpackbits(octets, axis=0, count=nb_bits, bitorder='little')
+    w = bits if dtype == np.uint8 else bits.astype(dtype)
+    if not with_hamming:
+        return w
+
+    if hasattr(np, 'bitwise_count') and nb_bits == 8*nb_bytes:
+        h = np.bitwise_count(values).astype(dtype)
+    else:
+        h = bits.sum(axis=0, dtype=dtype)
+    return (w, h)
+
 ### Conversion
 def to_hex(v, nb_bits=16):
     """ Convert the value 'v' into a hexadecimal string (without the prefix 0x)"""
@@ -69,6 +97,88 @@ def write_list(_input, uint_list, nb_bits=16):
     for uint in uint_list:
         write(_input, uint, nb_bits=nb_bits)
 
+# Lines 'xx\n' of the hexadecimal format of each byte
+_HEX_LINES = np.frombuffer(''.join('{:02x}\n'.format(i) for i in range(256)).encode('ascii'), dtype=np.uint8).reshape(256, 3)
+
+def to_hex_lines(uint_array, nb_bits=16):
+    """ Return the string written by 'write_list' for all the values of 'uint_array'
+    (in the order of 'uint_array.flatten()'), computed with numpy in one shot
+    Return None if the values can not be converted this way (not integers,
+        more than 64 bits or 'nb_bits' not multiple of 8)
+    """
+    values = np.asarray(uint_array)
+    if (values.dtype.kind not in 'iub') or (nb_bits > 64) or (nb_bits % 8):
+        return None
+
+    values = values.reshape(-1).astype(np.uint64) # Two's complement of the negative values
+    nb_bytes = nb_bits // 8
+    shifts = np.arange(8*(nb_bytes-1), -1, -8, dtype=np.uint64) # Most significant byte first
+    octets = ((values[:, None] >> shifts) & np.uint64(0xFF)).astype(np.uint8)
+    return _HEX_LINES[octets].tobytes().decode('ascii')
+
+def write_array(_input, uint_array, nb_bits=16):
+    """ Write in '_input' the values of 'uint_array' (in the order of 'uint_array.flatten()')
+    as 'write_list' does, but with a single call to '_input.write'
+    """
+    lines = to_hex_lines(uint_array, nb_bits=nb_bits)
+    if lines is None:
+        write_list(_input, np.asarray(uint_array).reshape(-1).tolist(), nb_bits=nb_bits)
+    else:
+        _input.write(lines)
+
+### Read function
+def read_traces(filenames, store_filename=None):
+    """ Read the power traces written by ELMO tool (one float per line)
+    Return a 2-dimensional numpy array of floats (a trace per row)
+    :filenames: List of the filenames of the traces, all with the same length
+    :store_filename: If not None, the traces are written in this .npy file
+        and the returned array is memory-mapped on it
+    """
+    def read_trace(filename):
+        with open(filename, 'rb') as _file:
+            return np.array(_file.read().split(), dtype=float)
+
+    first_trace = read_trace(filenames[0]) if filenames else np.zeros(0)
+    shape = (len(filenames), len(first_trace))
+    if store_filename is None:
+        traces = np.empty(shape)
+    elif filenames:
+        traces = np.lib.format.open_memmap(store_filename, mode='w+', dtype=float, shape=shape)
+    else:
+        np.save(store_filename, np.zeros(shape)) # An empty array can not be memory-mapped
+        return np.load(store_filename)
+
+    if filenames:
+        traces[0] = first_trace
+    for i in range(1, len(filenames)):
+        trace = read_trace(filenames[i])
+        if len(trace) != traces.shape[1]:
+            raise ValueError('The trace {} has {} points instead of {}.'.format(
+                filenames[i], len(trace), traces.shape[1],
+            ))
+        traces[i] = trace
+
+    if store_filename is not None:
+        traces.flush()
+    return traces
+
+### Timing
+class StageTimer:
+    """ Accumulate in the dictionary 'timings' the time (in seconds) spent in
+    the successive stages of a computation. If 'timings' is None, nothing is measured.
+    """
+    def __init__(self, timings=None):
+        self.timings = timings
+        self.last = time.perf_counter() if timings is not None else None
+
+    def lap(self, stage):
+        """ Add the time elapsed since the previous lap to the 'stage' """
+        if self.timings is None:
+            return
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.) + (now - self.last)
+        self.last = now
+
 ### Print Utils
 class Color:
     """ Color codes to print colored text in stdout """
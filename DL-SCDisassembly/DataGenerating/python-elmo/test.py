@@ -60,6 +60,63 @@ engine.reset_points() # Reset the engine to study other points
 
 assert power.shape == (256, )
 
+### Compare with a point-by-point evaluation of the ELMO model
+import numpy as np
+def reference_power(engine, triplet, previous_ops, current_ops):
+    """ Return the power of a single point computed with plain Python loops """
+    previous_type, current_type, subsequent_type = triplet
+    if current_type == Instr.OTHER:
+        return engine.constant[current_type]
+    bits = lambda n: [(n >> k) & 1 for k in range(32)]
+    dot = lambda a, coeffs: sum(a[k] * coeffs[k,current_type] for k in range(len(a)))
+    interactions = lambda a, coeffs: sum(
+        coeffs[count,current_type] * a[i] * a[j]
+        for count, (i, j) in enumerate((i, j) for i in range(32) for j in range(i+1,32))
+    )
+
+    previous = [int(previous_type == k) for k in range(1,5)]
+    subsequent = [int(subsequent_type == k) for k in range(1,5)]
+    op1, op2 = bits(current_ops[0]), bits(current_ops[1])
+    flip1, flip2 = bits(previous_ops[0] ^ current_ops[0]), bits(previous_ops[1] ^ current_ops[1])
+    hw1, hw2, hd1, hd2 = sum(op1), sum(op2), sum(flip1), sum(flip2)
+
+    return engine.constant[current_type] \
+        + dot(previous, engine.PrvInstr) + dot(subsequent, engine.SubInstr) \
+        + dot(op1, engine.Operand1) + dot(op2, engine.Operand2) \
+        + dot(flip1, engine.BitFlip1) + dot(flip2, engine.BitFlip2) \
+        + hw1 * dot(previous, engine.HWOp1PrvInstr) + hw2 * dot(previous, engine.HWOp2PrvInstr) \
+        + hd1 * dot(previous, engine.HDOp1PrvInstr) + hd2 * dot(previous, engine.HDOp2PrvInstr) \
+        + hw1 * dot(subsequent, engine.HWOp1SubInstr) + hw2 * dot(subsequent, engine.HWOp2SubInstr) \
+        + hd1 * dot(subsequent, engine.HDOp1SubInstr) + hd2 * dot(subsequent, engine.HDOp2SubInstr) \
+        + interactions(op1, engine.Operand1_bitinteractions) + interactions(op2, engine.Operand2_bitinteractions) \
+        + interactions(flip1, engine.BitFlip1_bitinteractions) + interactions(flip2, engine.BitFlip2_bitinteractions)
+
+for i in range(0, 256):
+    expected = reference_power(engine, (Instr.LDR, Instr.MUL, Instr.OTHER), (0x0000, i), (0x2BAC, i))
+    assert np.isclose(power[i], expected, rtol=1e-12, atol=1e-15), 'Power of point {} differs from the ELMO model'.format(i)
+
+### Compute the same points from arrays
+nb_points = 256
+power_from_arrays = engine.compute(
+    np.array([[Instr.LDR]*nb_points, [Instr.MUL]*nb_points, [Instr.OTHER]*nb_points]),
+    np.array([[0x0000]*nb_points, range(nb_points)]),
+    np.array([[0x2BAC]*nb_points, range(nb_points)]),
+    chunk_size=100,
+)
+assert np.allclose(power_from_arrays, power)
+
+### Decompose the power into the components of the model
+from elmo.engine import COMPONENTS
+components = engine.compute(
+    np.array([[Instr.LDR]*nb_points, [Instr.MUL]*nb_points, [Instr.OTHER]*nb_points]),
+    np.array([[0x0000]*nb_points, range(nb_points)]),
+    np.array([[0x2BAC]*nb_points, range(nb_points)]),
+    components=True,
+)
+assert components.dtype.names == COMPONENTS + ('power',)
+assert np.allclose(components['power'], power)
+assert np.allclose(sum(components[name] for name in COMPONENTS), power)
+
 print_success(' - Test 2 "Use ELMO Engine": Success!')
 
 #########################################################
@@ -70,6 +127,18 @@ from elmo import get_simulation
 KyberNTTSimulation = get_simulation('KyberNTTSimulation')
 simulation = KyberNTTSimulation()
 simulation.set_challenges(simulation.get_random_challenges(10))
+
+# The input of ELMO is written in bulk, as value by value
+import io
+from elmo.utils import write
+array_input, value_input = io.StringIO(), io.StringIO()
+for challenge in simulation.challenges[:3]:
+    simulation.set_input_for_each_challenge(array_input, challenge)
+    for polynomial in challenge:
+        for coefficient in polynomial:
+            write(value_input, coefficient)
+assert array_input.getvalue() == value_input.getvalue()
+
 res = simulation.run()
 
 assert not res['error']
@@ -82,12 +151,52 @@ asmtrace = simulation.get_asmtrace()
 for index, instr in enumerate(asmtrace):
     assert ('mul' in instr) == (index in multiplication_indexes)
 
+# The index of the ASM trace gives the instructions found by a scan of the trace
+from elmo.asmtrace import split_instruction
+muls_indexes = [index for index, instr in enumerate(asmtrace) if split_instruction(instr)[1] == 'muls']
+assert simulation.get_instruction_indexes('muls').tolist() == muls_indexes
+assert simulation.get_indexes_of(lambda instr: split_instruction(instr)[1] == 'muls') == muls_indexes
+
 traces = simulation.get_traces()
 traces = simulation.get_traces(multiplication_indexes)
 assert traces.shape == (10, len(multiplication_indexes))
 print(traces)
 printed_data = simulation.get_printed_data()
 
+### Compare with the same simulation split into shards
+parallel_simulation = KyberNTTSimulation(simulation.challenges)
+parallel_simulation.run_parallel(n_workers=2, shard_size=3)
+
+assert np.array_equal(parallel_simulation.get_traces(), simulation.get_traces())
+assert parallel_simulation.get_printed_data() == simulation.get_printed_data()
+assert parallel_simulation.get_asmtrace() == simulation.get_asmtrace()
+
+### Cache the results of the simulations
+import tempfile
+from elmo.project_base import SimulationProject
+from elmo.cache import ResultCache
+cache_directory = tempfile.mkdtemp()
+default_result_cache = SimulationProject._result_cache
+SimulationProject.set_result_cache(ResultCache(cache_directory))
+
+first_simulation = KyberNTTSimulation(simulation.challenges)
+first_simulation.run(use_cache=True)
+assert not first_simulation.is_from_cache
+
+cached_simulation = KyberNTTSimulation(simulation.challenges)
+cached_simulation.run(use_cache=True)
+assert cached_simulation.is_from_cache
+assert np.array_equal(cached_simulation.get_traces(), first_simulation.get_traces())
+assert cached_simulation.get_printed_data() == first_simulation.get_printed_data()
+
+other_simulation = KyberNTTSimulation(simulation.challenges[:5])
+other_simulation.run(use_cache=True)
+assert not other_simulation.is_from_cache
+assert other_simulation.get_number_of_traces() == 5
+
+SimulationProject.set_result_cache(default_result_cache)
+shutil.rmtree(cache_directory)
+
 print_success(' - Test 3 "Use A Real Simulation": Success!')
 
 #########################################################
@@ -99,7 +208,14 @@ def test_online_server():
     KyberNTTSimulation = get_simulation('KyberNTTSimulation')
     simulation = KyberNTTSimulation()
     simulation.set_challenges(simulation.get_random_challenges(10))
-    return simulation.run_online()
+    res = simulation.run_online()
+
+    # Receive the same traces while the server is running ELMO
+    streamed_simulation = KyberNTTSimulation(simulation.challenges)
+    streamed_traces = np.array(list(streamed_simulation.stream_online()))
+    assert np.array_equal(streamed_traces, simulation.get_traces())
+    assert streamed_simulation.get_printed_data() == simulation.get_printed_data()
+    return res
 
 from elmo.executor import launch_executor
 # Launch the server and realize the test